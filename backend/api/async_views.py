@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse
+from rest_framework import exceptions, status
+
+from api import toggles
+from api_users.authentication import CachedTokenAuthentication
+from backend import settings
+
+# sync_to_async по умолчанию выполняет всё в одном общем потоке, и
+# переключатели воркера шли бы к базе по одному. Свой пул даёт
+# ASYNC_TOGGLE_THREADS параллельных запросов.
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_TOGGLE_THREADS, thread_name_prefix='toggles'
+)
+
+
+def authenticate(request):
+    authenticator = CachedTokenAuthentication()
+    result = authenticator.authenticate(request)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    return result[0]
+
+
+def toggle(handler, request, *args):
+    # Сигналы начала и конца запроса закрывают соединения только своего
+    # потока, соединения пула проверяются здесь по CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        user = authenticate(request)
+        return handler(request.method, user.pk, *args)
+    finally:
+        close_old_connections()
+
+
+async def respond(handler, request, *args):
+    headers = {}
+    try:
+        # Проверка токена и запрос к БД выполняются за один переход
+        # в поток, event loop при этом не блокируется. Контекст
+        # копируется, чтобы роутер реплик видел состояние запроса.
+        context = contextvars.copy_context()
+        status_code, data = await asyncio.get_running_loop().run_in_executor(
+            executor, context.run, toggle, handler, request, *args
+        )
+    except exceptions.APIException as exc:
+        status_code, data = exc.status_code, {'detail': exc.detail}
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            headers['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+    # У ответа 204 не может быть тела, ASGI-сервер его не пропустит.
+    if data is None or status_code == status.HTTP_204_NO_CONTENT:
+        response = HttpResponse(status=status_code)
+    else:
+        response = JsonResponse(
+            data,
+            status=status_code,
+            safe=False,
+            json_dumps_params={'ensure_ascii': False},
+        )
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+async def favorite(request, recipe_id):
+    return await respond(toggles.toggle_favorite, request, recipe_id)
+
+
+async def shopping_cart(request, recipe_id):
+    return await respond(toggles.toggle_shopping_cart, request, recipe_id)
+
+
+async def subscribe(request, pk):
+    return await respond(toggles.toggle_subscribe, request, pk)
+
+
+# csrf_exempt в Django 3.2 не поддерживает async-представления.
+for view in (favorite, shopping_cart, subscribe):
+    view.csrf_exempt = True
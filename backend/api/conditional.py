@@ -0,0 +1,38 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+
+
+def make_etag(*parts):
+    key = ':'.join(str(part) for part in parts)
+    return '"' + hashlib.md5(key.encode()).hexdigest() + '"'
+
+
+def set_validators(response, etag):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+    return response
+
+
+def get_not_modified(request, etag):
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_validators(response, etag)
+    return response
+
+
+# Представление с этой примесью определяет get_etag() без аргументов.
+class ConditionalMixin:
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_etag()
+        response = get_not_modified(request, etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return set_validators(response, etag)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from backend import settings
+
+PREFIX = 'db:stats'
+COUNTERS = (
+    'requests',
+    'opened',
+    'reused',
+    'health_checks',
+    'health_check_failures',
+)
+
+# Счётчики копятся в памяти процесса и переносятся в общий кэш не чаще
+# раза в DB_STATS_FLUSH_SECONDS, чтобы запрос не ходил в кэш.
+_lock = threading.Lock()
+_pending = dict.fromkeys(COUNTERS, 0)
+_flushed_at = time.monotonic()
+
+
+def count(name, delta=1):
+    with _lock:
+        _pending[name] += delta
+        due = (
+            time.monotonic() - _flushed_at
+            >= settings.DB_STATS_FLUSH_SECONDS
+        )
+    if due:
+        flush()
+
+
+def flush():
+    global _flushed_at
+    with _lock:
+        pending = {name: value for name, value in _pending.items() if value}
+        for name in pending:
+            _pending[name] = 0
+        _flushed_at = time.monotonic()
+    for name, value in pending.items():
+        key = f'{PREFIX}:{name}'
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+
+
+def get_stats():
+    flush()
+    keys = {f'{PREFIX}:{name}': name for name in COUNTERS}
+    values = cache.get_many(keys)
+    stats = {name: values.get(key, 0) for key, name in keys.items()}
+    stats['reuse_ratio'] = (
+        round(stats['reused'] / stats['requests'], 4)
+        if stats['requests'] else None
+    )
+    return stats
+
+
+def reset_stats():
+    with _lock:
+        for name in _pending:
+            _pending[name] = 0
+    cache.delete_many([f'{PREFIX}:{name}' for name in COUNTERS])
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    count('opened')
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    count('requests')
+    now = time.monotonic()
+    for connection in connections.all():
+        # Закрытое соединение Django откроет сам при первом запросе
+        # к этой базе, реплику - только если запрос к ней пойдёт.
+        if connection.connection is None:
+            continue
+        last_used = getattr(connection, 'last_used_at', now)
+        connection.last_used_at = now
+        # В Django 3.2 нет CONN_HEALTH_CHECKS, проверяем сами, но только
+        # соединение, которое долго простаивало: недавно работавшее
+        # почти наверняка живо, а SELECT 1 на каждый запрос дорог.
+        if (
+            not connection.in_atomic_block
+            and connection.settings_dict.get('CONN_HEALTH_CHECKS')
+            and now - last_used >= settings.DB_HEALTH_CHECK_IDLE_SECONDS
+        ):
+            count('health_checks')
+            if not connection.is_usable():
+                count('health_check_failures')
+                connection.close()
+                continue
+        count('reused')
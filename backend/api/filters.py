@@ -1,39 +1,60 @@
 import django_filters as filters
+from django.db.models import Exists, OuterRef
+from django_filters.widgets import BooleanWidget
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.serializers import get_tag_list
+from recipes import search
+from recipes.models import Favorite, Recipe, ShoppingCart, TagsInRecipe
+
+
+def get_tag_choices():
+    return [(tag['slug'], tag['name']) for tag in get_tag_list()]
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    # Слаги проверяются по закэшированному списку тегов, а каждый фильтр
+    # сужает один и тот же queryset через EXISTS: без JOIN нет дублей
+    # и не нужен DISTINCT.
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices, method='get_tags'
+    )
+    # BooleanWidget понимает 1/0, которые шлёт фронтенд.
+    is_favorited = filters.BooleanFilter(
+        method='get_is_favorited', widget=BooleanWidget()
     )
-    is_favorited = filters.CharFilter(method='get_is_favorited')
-    is_in_shopping_cart = filters.CharFilter(
-        method='get_is_in_shopping_cart'
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='get_is_in_shopping_cart', widget=BooleanWidget()
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
+
+    def get_tags(self, queryset, name, value):
+        slugs = set(value)
+        tag_ids = [tag['id'] for tag in get_tag_list() if tag['slug'] in slugs]
+        return queryset.filter(Exists(TagsInRecipe.objects.filter(
+            recipe=OuterRef('pk'), tag__in=tag_ids
+        )))
+
+    def get_user_relation(self, queryset, model, value):
+        if not value:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            recipe=OuterRef('pk'), user=user
+        )))
 
     def get_is_favorited(self, queryset, name, value):
-        user = self.request.user
-        if value:
-            return Recipe.objects.filter(favorite__user=user)
-        return Recipe.objects.all()
+        return self.get_user_relation(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value:
-            return Recipe.objects.filter(shopping_cart__user=user)
-        return Recipe.objects.all()
-
+        return self.get_user_relation(queryset, ShoppingCart, value)
 
-class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='startswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def get_search(self, queryset, name, value):
+        return search.search(queryset, value)
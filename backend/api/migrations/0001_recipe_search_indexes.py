@@ -0,0 +1,51 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+from backend import settings
+
+# Индексы полнотекстового и нечёткого поиска (recipes/search.py) есть
+# только в PostgreSQL. Другие базы ищут по индексу в памяти, поэтому
+# индексы не описаны в Meta модели и создаются здесь.
+SEARCH_INDEXES = (
+    GinIndex(
+        SearchVector('search_document', config=settings.RECIPE_SEARCH_CONFIG),
+        name='recipe_search_document_idx',
+    ),
+    GinIndex(
+        fields=('name',),
+        name='recipe_name_trgm_idx',
+        opclasses=('gin_trgm_ops',),
+    ),
+)
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    recipe = apps.get_model('recipes', 'Recipe')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(recipe, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    recipe = apps.get_model('recipes', 'Recipe')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(recipe, index)
+
+
+class Migration(migrations.Migration):
+
+    # Миграции recipes создаются при развёртывании (makemigrations
+    # recipes), поэтому зависимость на первую из них.
+    dependencies = [
+        ('recipes', '__first__'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -1,11 +1,11 @@
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from django.db import transaction
-from django.core.exceptions import ValidationError
 
+from api.uploads import RecipeImageField, parse_multipart
 from api_users.serializers import CustomUserSerializer
-from recipes import models
-from backend import settings
+from recipes import cache, images, models
+from backend import replicas, settings
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -14,6 +14,17 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
+def get_tag_list():
+    return cache.tags.get_or_set(
+        'list',
+        lambda: [
+            dict(tag) for tag in TagSerializer(
+                models.Tag.objects.all(), many=True
+            ).data
+        ],
+    )
+
+
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(
         source='ingredient.id',
@@ -36,15 +47,12 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class ShowRecipeSerializer(serializers.ModelSerializer):
+class RecipeContentSerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     image = Base64ImageField()
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField('get_ingredients')
-    is_favorited = serializers.SerializerMethodField('get_is_favorited')
-    is_in_shopping_cart = serializers.SerializerMethodField(
-        'get_is_in_shopping_cart'
-    )
+    image_variants = serializers.SerializerMethodField('get_image_variants')
 
     class Meta:
         model = models.Recipe
@@ -53,39 +61,119 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
             'tags',
             'author',
             'ingredients',
-            'is_favorited',
-            'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
     def get_ingredients(self, obj):
-        ingredients = models.IngredientInRecipe.objects.filter(recipe=obj)
+        ingredients = obj.ingredientinrecipe_set.all()
         return IngredientInRecipeSerializer(ingredients, many=True).data
 
-    def get_is_favorited(self, obj):
+    def get_image_variants(self, obj):
+        if not obj.image:
+            return {}
+        return {
+            variant: images.get_variant_urls(
+                obj.image.name, obj.image_variants, variant
+            )
+            for variant in settings.IMAGE_VARIANTS
+        }
+
+
+class ShowRecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        return self.child.to_representation_many(
+            list(data), settings.LIST_IMAGE_VARIANT
+        )
+
+
+class ShowRecipeSerializer(serializers.ModelSerializer):
+    # Все поля собирает to_representation_many, объявления описывают
+    # только форму ответа.
+    image_formats = serializers.DictField(read_only=True)
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = models.Recipe
+        list_serializer_class = ShowRecipeListSerializer
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'favorites_count',
+            'in_carts_count',
+            'name',
+            'image',
+            'image_formats',
+            'text',
+            'cooking_time',
+        )
+        read_only_fields = ('tags', 'author', 'ingredients')
+
+    def to_representation(self, instance):
+        return self.to_representation_many(
+            [instance], settings.DETAIL_IMAGE_VARIANT
+        )[0]
+
+    def to_representation_many(self, recipes, image_variant):
+        contents = cache.get_many(recipe.pk for recipe in recipes)
+        missing = [
+            recipe.pk for recipe in recipes if recipe.pk not in contents
+        ]
+        if missing:
+            with replicas.use_primary():
+                rendered = {
+                    item['id']: item for item in RecipeContentSerializer(
+                        models.Recipe.objects.filter(
+                            pk__in=missing
+                        ).with_relations(),
+                        many=True,
+                    ).data
+                }
+            cache.set_many(rendered)
+            contents.update(rendered)
         request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        user = request.user
-        return models.Favorite.objects.filter(recipe=obj, user=user).exists()
+        favorites, cart = self.get_user_flags()
+        result = []
+        for recipe in recipes:
+            data = dict(contents[recipe.pk])
+            data['is_favorited'] = recipe.pk in favorites
+            data['is_in_shopping_cart'] = recipe.pk in cart
+            # Счётчики меняются чаще содержимого, поэтому берутся из
+            # строки рецепта, а не из кэша.
+            data['favorites_count'] = recipe.favorites_count
+            data['in_carts_count'] = recipe.in_carts_count
+            formats = data['image_variants'].get(image_variant, {})
+            data['image'] = formats.get('jpeg', data['image'])
+            data['image_formats'] = formats
+            if request is not None:
+                data['image'] = data['image'] and request.build_absolute_uri(
+                    data['image']
+                )
+                data['image_formats'] = {
+                    key: request.build_absolute_uri(url)
+                    for key, url in formats.items()
+                }
+            result.append({field: data[field] for field in self.Meta.fields})
+        return result
 
-    def get_is_in_shopping_cart(self, obj):
+    def get_user_flags(self):
         request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        user = request.user
-        return models.ShoppingCart.objects.filter(
-            recipe=obj, user=user
-        ).exists()
+        if request is None:
+            return frozenset(), frozenset()
+        return cache.get_user_flags(request.user)
 
 
 class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=models.Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
 
     class Meta:
         model = models.IngredientInRecipe
@@ -93,7 +181,7 @@ class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = AddIngredientToRecipeSerializer(many=True)
     cooking_time = serializers.IntegerField()
@@ -114,6 +202,11 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = parse_multipart(data)
+        return super().to_internal_value(data)
+
     def validate_cooking_time(self, data):
         if data < settings.MIN_COOKING_TIME:
             raise serializers.ValidationError(
@@ -121,68 +214,110 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             )
         return data
 
+    def validate_ingredients(self, data):
+        amounts = {}
+        for ingredient in data:
+            amount = ingredient['amount']
+            if amount is None or settings.MIN_AMOUNT_VALUE > amount:
+                raise serializers.ValidationError(
+                    f'Введите >= {settings.MIN_AMOUNT_VALUE} для Ингредиента'
+                )
+            ingredient_id = ingredient['id']
+            amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+        found = set(
+            models.Ingredient.objects.filter(
+                pk__in=amounts
+            ).values_list('pk', flat=True)
+        )
+        missing = [pk for pk in amounts if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}'
+            )
+        return amounts
+
     @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
         author = self.context.get('request').user
         recipe = models.Recipe.objects.create(author=author, **validated_data)
-        for ingredient in ingredients_data:
-            ingredient_model = ingredient['id']
-            amount = ingredient['amount']
-            if settings.MIN_AMOUNT_VALUE > amount:
-                raise ValidationError(
-                    f'Введите >= {settings.MIN_AMOUNT_VALUE} для Ингредиента'
-                )
-            if models.IngredientInRecipe.objects.filter(
-                ingredient=ingredient_model, recipe=recipe
-            ).exists():
-                iir = models.IngredientInRecipe.objects.get(
-                    ingredient=ingredient_model, recipe=recipe
-                )
-                iir.amount = iir.amount + amount
-                iir.save(update_fields=['amount'])
-            else:
-                models.IngredientInRecipe.objects.create(
-                    ingredient=ingredient_model, recipe=recipe, amount=amount
-                )
-        recipe.tags.set(tags_data)
+        models.IngredientInRecipe.objects.bulk_create(
+            models.IngredientInRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in ingredients_data.items()
+        )
+        models.TagsInRecipe.objects.bulk_create(
+            models.TagsInRecipe(recipe=recipe, tag=tag)
+            for tag in set(tags_data)
+        )
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        models.TagsInRecipe.objects.filter(recipe=instance).delete()
-        models.IngredientInRecipe.objects.filter(recipe=instance).delete()
-        for ingredient in ingredients_data:
-            ingredient_model = ingredient['id']
-            amount = ingredient['amount']
-            if settings.MIN_AMOUNT_VALUE > amount:
-                raise ValidationError(
-                    f'Введите >= {settings.MIN_AMOUNT_VALUE} для Ингредиента'
-                )
-            if models.IngredientInRecipe.objects.filter(
-                ingredient=ingredient_model, recipe=instance
-            ).exists():
-                iir = models.IngredientInRecipe.objects.get(
-                    ingredient=ingredient_model, recipe=instance
-                )
-                iir.amount = iir.amount + amount
-                iir.save(update_fields=['amount'])
-            else:
-                models.IngredientInRecipe.objects.create(
-                    ingredient=ingredient_model, recipe=instance, amount=amount
-                )
+        self.sync_ingredients(instance, ingredients_data)
+        self.sync_tags(instance, tags_data)
         instance.name = validated_data.pop('name')
         instance.text = validated_data.pop('text')
         if validated_data.get('image') is not None:
             instance.image = validated_data.pop('image')
         instance.cooking_time = validated_data.pop('cooking_time')
-        instance.tags.set(tags_data)
         instance.save()
         return instance
 
+    def sync_ingredients(self, recipe, amounts):
+        existing = {
+            row.ingredient_id: row
+            for row in models.IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            models.IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        removed = [pk for pk in existing if pk not in amounts]
+        if removed:
+            models.IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        added = [pk for pk in amounts if pk not in existing]
+        if added:
+            models.IngredientInRecipe.objects.bulk_create(
+                (
+                    models.IngredientInRecipe(
+                        recipe=recipe, ingredient_id=pk, amount=amounts[pk]
+                    )
+                    for pk in added
+                ),
+                ignore_conflicts=True,
+            )
+
+    def sync_tags(self, recipe, tags):
+        existing = set(
+            models.TagsInRecipe.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        wanted = {tag.pk for tag in tags}
+        if existing - wanted:
+            models.TagsInRecipe.objects.filter(
+                recipe=recipe, tag_id__in=existing - wanted
+            ).delete()
+        if wanted - existing:
+            models.TagsInRecipe.objects.bulk_create(
+                (
+                    models.TagsInRecipe(recipe=recipe, tag_id=pk)
+                    for pk in wanted - existing
+                ),
+                ignore_conflicts=True,
+            )
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(
@@ -201,3 +336,14 @@ class ShoppingCartSerializer(FavoriteSerializer):
     class Meta:
         model = models.ShoppingCart
         fields = ('recipe', 'user')
+
+
+class BulkRecipesSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+
+from django.db.models import Count, Max, Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from api import conditional
+from backend import settings
+from recipes import cache, models
+
+CHUNK_SIZE = 500
+PDF_FONT = 'ShoppingListFont'
+
+
+def get_ingredients(user):
+    return models.IngredientInRecipe.objects.filter(
+        recipe__shopping_cart__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(sum_amount=Sum('amount')).order_by('ingredient__name')
+
+
+def iter_rows(user):
+    for ingredient in get_ingredients(user).iterator(chunk_size=CHUNK_SIZE):
+        yield (
+            ingredient['ingredient__name'],
+            ingredient['sum_amount'],
+            ingredient['ingredient__measurement_unit'],
+        )
+
+
+def get_cart_state(user):
+    return models.ShoppingCart.objects.filter(user=user).aggregate(
+        count=Count('id'),
+        last_id=Max('id'),
+        updated_at=Max('recipe__updated_at'),
+    )
+
+
+def get_etag(user, state, file_format):
+    # Список не читается ради ETag. Состав корзины меняет число записей
+    # или последний id, правка состава рецепта - его updated_at, а
+    # переименование ингредиента - версию кэша рецептов.
+    return conditional.make_etag(
+        user.pk,
+        file_format,
+        cache.get_version(),
+        state['count'],
+        state['last_id'],
+        state['updated_at'],
+    )
+
+
+def render_txt(rows):
+    for name, amount, measurement_unit in rows:
+        yield f'{name} - {amount} {measurement_unit}\n'
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_json(rows):
+    separator = '['
+    for name, amount, measurement_unit in rows:
+        yield separator + json.dumps(
+            {
+                'name': name,
+                'amount': amount,
+                'measurement_unit': measurement_unit,
+            },
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+def render_pdf(rows):
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT, settings.PDF_FONT_PATH))
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = 50
+    line_height = 18
+    y = height - margin
+    document.setFont(PDF_FONT, 16)
+    document.drawString(margin, y, 'Список покупок')
+    y -= line_height * 2
+    document.setFont(PDF_FONT, 12)
+    for name, amount, measurement_unit in rows:
+        if y < margin:
+            document.showPage()
+            document.setFont(PDF_FONT, 12)
+            y = height - margin
+        document.drawString(
+            margin, y, f'• {name} - {amount} {measurement_unit}'
+        )
+        y -= line_height
+    document.save()
+    yield buffer.getvalue()
+
+
+FORMATS = {
+    'txt': (settings.CONTENT_TYPE_CONST, render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json', render_json),
+    'pdf': ('application/pdf', render_pdf),
+}
@@ -0,0 +1,191 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes import models
+from users.models import Follow, User
+
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+DOWNLOAD_URL = '/api/recipes/download_shopping_cart/'
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ShoppingListTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass'
+        )
+        self.ingredient = models.Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        self.recipes = [self.create_recipe(name) for name in ('Блины', 'Хлеб')]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.amount = models.IngredientInRecipe.objects.create(
+                recipe=self.recipes[0], ingredient=self.ingredient, amount=100
+            )
+            models.ShoppingCart.objects.create(
+                user=self.user, recipe=self.recipes[0]
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, name):
+        models.Recipe.objects.bulk_create([models.Recipe(
+            author=self.user,
+            name=name,
+            text='Описание',
+            cooking_time=1,
+            image='recipe.png',
+        )])
+        return models.Recipe.objects.get(name=name)
+
+    def download(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(DOWNLOAD_URL, **headers)
+
+    def test_content(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'Мука - 100 г\n',
+        )
+
+    def test_empty_cart(self):
+        models.ShoppingCart.objects.filter(user=self.user).delete()
+        self.assertEqual(self.download().status_code, 400)
+
+    def test_not_modified_does_not_read_list(self):
+        etag = self.download()['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.download(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+    def assertEtagChanged(self, change):
+        etag = self.download()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.download(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cart_change_changes_etag(self):
+        self.assertEtagChanged(
+            lambda: models.ShoppingCart.objects.create(
+                user=self.user, recipe=self.recipes[1]
+            )
+        )
+
+    def test_cart_swap_changes_etag(self):
+        def swap():
+            models.ShoppingCart.objects.filter(user=self.user).delete()
+            models.ShoppingCart.objects.create(
+                user=self.user, recipe=self.recipes[1]
+            )
+
+        self.assertEtagChanged(swap)
+
+    def test_amount_change_changes_etag(self):
+        def change_amount():
+            self.amount.amount = 200
+            self.amount.save()
+
+        self.assertEtagChanged(change_amount)
+
+    def test_ingredient_rename_changes_etag(self):
+        def rename():
+            self.ingredient.name = 'Мука пшеничная'
+            self.ingredient.save()
+
+        self.assertEtagChanged(rename)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TogglesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass'
+        )
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        models.Recipe.objects.bulk_create([models.Recipe(
+            author=self.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=1,
+            image='recipe.png',
+        )])
+        self.recipe = models.Recipe.objects.get(author=self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertStatuses(self, url, method, expected):
+        for status_code in expected:
+            response = getattr(self.client, method)(url)
+            self.assertEqual(response.status_code, status_code, response.data)
+
+    def check_recipe_toggle(self, name, model, counter):
+        url = f'/api/recipes/{self.recipe.pk}/{name}/'
+        self.assertStatuses(url, 'post', (201, 400))
+        self.assertTrue(model.objects.filter(
+            user=self.user, recipe=self.recipe
+        ).exists())
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter), 1)
+
+        self.assertStatuses(url, 'delete', (204, 400))
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter), 0)
+
+        missing = f'/api/recipes/{self.recipe.pk + 1}/{name}/'
+        response = self.client.post(missing)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('recipe', response.data)
+        self.assertStatuses(missing, 'delete', (404,))
+
+    def test_favorite(self):
+        self.check_recipe_toggle(
+            'favorite', models.Favorite, 'favorites_count'
+        )
+
+    def test_shopping_cart(self):
+        self.check_recipe_toggle(
+            'shopping_cart', models.ShoppingCart, 'in_carts_count'
+        )
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        self.assertStatuses(url, 'post', (201, 400))
+        self.assertTrue(Follow.objects.filter(
+            user=self.user, following=self.author
+        ).exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+        self.assertStatuses(url, 'delete', (204, 204))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+        self.assertStatuses(
+            f'/api/users/{self.user.pk}/subscribe/', 'post', (400,)
+        )
+        missing = f'/api/users/{self.author.pk + 1}/subscribe/'
+        self.assertStatuses(missing, 'post', (404,))
+        self.assertStatuses(missing, 'delete', (404,))
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertStatuses(
+            f'/api/recipes/{self.recipe.pk}/favorite/', 'post', (401,)
+        )
@@ -0,0 +1,240 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from rest_framework import exceptions, serializers, status
+from rest_framework.response import Response
+
+from backend import replicas
+from recipes import cache, counters, feed, models
+from users.models import Follow
+
+User = get_user_model()
+
+ADDED = 'added'
+REMOVED = 'removed'
+ALREADY_ADDED = 'exists'
+NOT_ADDED = 'absent'
+NOT_FOUND = 'not_found'
+
+
+def insert_link(model, user_id, target_model, field, target_id):
+    # INSERT ... SELECT сразу проверяет, что объект существует,
+    # а ON CONFLICT делает повтор безопасным: одна команда к БД.
+    where = 'id = %s'
+    params = [user_id, target_id]
+    if target_model is User:
+        where += ' AND id <> %s'
+        params.append(user_id)
+    # Счётчик меняется в той же транзакции, что и связь.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {model._meta.db_table} (user_id, {field}) '
+            f'SELECT %s, id FROM {target_model._meta.db_table} '
+            f'WHERE {where} ON CONFLICT DO NOTHING',
+            params,
+        )
+        added = cursor.rowcount == 1
+        if added:
+            counters.change(model, target_id, 1)
+    if added:
+        replicas.written()
+    return added
+
+
+def delete_link(model, user_id, field, target_id):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table} '
+            f'WHERE user_id = %s AND {field} = %s',
+            (user_id, target_id),
+        )
+        removed = cursor.rowcount > 0
+        if removed:
+            counters.change(model, target_id, -1)
+    if removed:
+        replicas.written()
+    return removed
+
+
+def user_flags_changed(user_id):
+    user_ids = (user_id,)
+    transaction.on_commit(lambda: cache.invalidate_user_flags(user_ids))
+
+
+def add_recipe(model, user_id, recipe_id):
+    added = insert_link(
+        model, user_id, models.Recipe, 'recipe_id', recipe_id
+    )
+    if added:
+        user_flags_changed(user_id)
+    return added
+
+
+def remove_recipe(model, user_id, recipe_id):
+    removed = delete_link(model, user_id, 'recipe_id', recipe_id)
+    if removed:
+        user_flags_changed(user_id)
+    return removed
+
+
+def get_recipe_links(model, user_id, recipe_ids):
+    # Один запрос с IN: какие рецепты существуют и какие из них уже
+    # связаны с пользователем.
+    return dict(
+        models.Recipe.objects.filter(pk__in=recipe_ids).annotate(
+            linked=Exists(
+                model.objects.filter(user_id=user_id, recipe=OuterRef('pk'))
+            )
+        ).values_list('pk', 'linked')
+    )
+
+
+def add_recipes(model, user_id, recipe_ids):
+    links = get_recipe_links(model, user_id, recipe_ids)
+    new_ids = [pk for pk in recipe_ids if pk in links and not links[pk]]
+    if new_ids:
+        with transaction.atomic():
+            model.objects.bulk_create(
+                (model(user_id=user_id, recipe_id=pk) for pk in new_ids),
+                ignore_conflicts=True,
+            )
+            # Повторный запрос мог добавить те же рецепты параллельно,
+            # bulk_create их молча пропустит, поэтому счётчики
+            # пересчитываются по данным.
+            counters.reconcile(model, new_ids)
+        replicas.written()
+        user_flags_changed(user_id)
+    return {
+        pk: NOT_FOUND if pk not in links
+        else ALREADY_ADDED if links[pk] else ADDED
+        for pk in recipe_ids
+    }
+
+
+def delete_links_returning(model, user_id, recipe_ids=None):
+    # Один DELETE; RETURNING сообщает, какие связи действительно были.
+    where = 'user_id = %s'
+    params = [user_id]
+    if recipe_ids is not None:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        where += f' AND recipe_id IN ({placeholders})'
+        params.extend(recipe_ids)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table} '
+            f'WHERE {where} RETURNING recipe_id',
+            params,
+        )
+        removed = [row[0] for row in cursor.fetchall()]
+        if removed:
+            counters.change_many(model, removed, -1)
+    if removed:
+        replicas.written()
+        user_flags_changed(user_id)
+    return removed
+
+
+def remove_recipes(model, user_id, recipe_ids):
+    removed = set(delete_links_returning(model, user_id, recipe_ids))
+    rest = [pk for pk in recipe_ids if pk not in removed]
+    existing = set(
+        models.Recipe.objects.filter(pk__in=rest).values_list('pk', flat=True)
+    ) if rest else set()
+    return {
+        pk: REMOVED if pk in removed
+        else NOT_ADDED if pk in existing else NOT_FOUND
+        for pk in recipe_ids
+    }
+
+
+def clear_recipes(model, user_id):
+    return len(delete_links_returning(model, user_id))
+
+
+def recipe_exists(recipe_id):
+    return models.Recipe.objects.filter(pk=recipe_id).exists()
+
+
+def follow(user_id, following_id):
+    followed = insert_link(
+        Follow, user_id, User, 'following_id', following_id
+    )
+    if followed:
+        feed.backfill(user_id, following_id)
+    return followed
+
+
+def unfollow(user_id, following_id):
+    unfollowed = delete_link(Follow, user_id, 'following_id', following_id)
+    if unfollowed:
+        feed.prune(user_id, following_id)
+    return unfollowed
+
+
+def user_exists(user_id):
+    return User.objects.filter(pk=user_id).exists()
+
+
+def toggle_recipe(model, exists_message, method, user_id, recipe_id):
+    # Добавление и удаление - одна команда к БД. Причину отказа
+    # выясняет дополнительный запрос, только если команда ничего
+    # не изменила.
+    if method == 'POST':
+        if add_recipe(model, user_id, recipe_id):
+            return status.HTTP_201_CREATED, {
+                'recipe': recipe_id,
+                'user': user_id,
+            }
+        if not recipe_exists(recipe_id):
+            field = serializers.PrimaryKeyRelatedField
+            message = field.default_error_messages['does_not_exist']
+            return status.HTTP_400_BAD_REQUEST, {
+                'recipe': [str(message).format(pk_value=recipe_id)],
+            }
+        return status.HTTP_400_BAD_REQUEST, {'Ошибка': exists_message}
+    if method == 'DELETE':
+        if remove_recipe(model, user_id, recipe_id):
+            return status.HTTP_204_NO_CONTENT, None
+        if not recipe_exists(recipe_id):
+            raise exceptions.NotFound()
+        return status.HTTP_400_BAD_REQUEST, None
+    raise exceptions.MethodNotAllowed(method)
+
+
+def toggle_favorite(method, user_id, recipe_id):
+    return toggle_recipe(
+        models.Favorite, 'Уже в избранном', method, user_id, recipe_id
+    )
+
+
+def toggle_shopping_cart(method, user_id, recipe_id):
+    return toggle_recipe(
+        models.ShoppingCart, 'Уже есть в корзине', method, user_id, recipe_id
+    )
+
+
+def toggle_subscribe(method, user_id, following_id):
+    if method in ('GET', 'POST'):
+        if follow(user_id, following_id):
+            return status.HTTP_201_CREATED, {
+                'user': user_id,
+                'following': following_id,
+            }
+        if not user_exists(following_id):
+            raise exceptions.NotFound()
+        if following_id == user_id:
+            return status.HTTP_400_BAD_REQUEST, {
+                'non_field_errors': ['На себя нельзя подписаться'],
+            }
+        return status.HTTP_400_BAD_REQUEST, 'Вы уже подписаны'
+    if method == 'DELETE':
+        if not unfollow(user_id, following_id):
+            if not user_exists(following_id):
+                raise exceptions.NotFound()
+        return status.HTTP_204_NO_CONTENT, 'Удалено'
+    raise exceptions.MethodNotAllowed(method)
+
+
+def respond(handler, request, *args):
+    status_code, data = handler(request.method, request.user.pk, *args)
+    return Response(data, status=status_code)
@@ -0,0 +1,92 @@
+import io
+import json
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from backend import settings
+
+JSON_FIELDS = ('tags', 'ingredients')
+
+
+class ImageTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = (
+        'Изображение больше '
+        f'{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ'
+    )
+    default_code = 'image_too_large'
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        if content_length > settings.RECIPE_UPLOAD_MAX_SIZE:
+            raise ImageTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ImageTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+def get_image_format(file):
+    position = file.tell()
+    try:
+        # Image.open читает только заголовок, пиксели не декодируются.
+        image = Image.open(file)
+        width, height = image.size
+        image_format = image.format
+    except (OSError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Загрузите корректное изображение')
+    finally:
+        file.seek(position)
+    if max(width, height) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+        raise serializers.ValidationError(
+            'Сторона изображения больше '
+            f'{settings.RECIPE_IMAGE_MAX_DIMENSION} пикселей'
+        )
+    return 'jpg' if image_format == 'JPEG' else image_format.lower()
+
+
+def parse_multipart(data):
+    result = data.dict()
+    for field in JSON_FIELDS:
+        values = data.getlist(field)
+        if len(values) == 1 and values[0].lstrip().startswith('['):
+            try:
+                result[field] = json.loads(values[0])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {field: ['Некорректный JSON']}
+                )
+        elif values:
+            result[field] = values
+    return result
+
+
+class RecipeImageField(Base64ImageField):
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            if data.size > settings.RECIPE_IMAGE_MAX_SIZE:
+                raise ImageTooLarge()
+            if get_image_format(data) not in self.ALLOWED_TYPES:
+                raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+            return serializers.ImageField.to_internal_value(self, data)
+        if (
+            isinstance(data, str)
+            and len(data) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE
+        ):
+            raise ImageTooLarge()
+        return super().to_internal_value(data)
+
+    def get_file_extension(self, filename, decoded_file):
+        get_image_format(io.BytesIO(decoded_file))
+        return super().get_file_extension(filename, decoded_file)
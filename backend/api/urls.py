@@ -2,14 +2,20 @@ from django.conf.urls import include
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from api import async_views
 from api.views import (
+    BulkFavoriteView,
+    BulkShoppingCartView,
     FavoriteView,
     IngredientsView,
     RecipeView,
     ShoppingCartViewSet,
     TagView,
+    clear_shopping_cart,
     download_shopping_cart,
+    readiness,
 )
+from backend import settings
 
 router = DefaultRouter()
 router.register(r'tags', TagView, basename='tags')
@@ -17,18 +23,36 @@ router.register(r'ingredients', IngredientsView, basename='ingredients')
 router.register(r'recipes', RecipeView, basename='recipes')
 
 urlpatterns = [
+    path('health/ready/', readiness, name='readiness'),
     path(
         'recipes/download_shopping_cart/',
         download_shopping_cart,
         name='download',
     ),
+    path(
+        'recipes/favorite/',
+        BulkFavoriteView.as_view(),
+        name='favorite-bulk',
+    ),
+    path(
+        'recipes/shopping_cart/',
+        BulkShoppingCartView.as_view(),
+        name='shopping-cart-bulk',
+    ),
+    path(
+        'recipes/shopping_cart/clear/',
+        clear_shopping_cart,
+        name='shopping-cart-clear',
+    ),
     path(
         'recipes/<int:recipe_id>/favorite/',
-        FavoriteView.as_view(),
+        async_views.favorite
+        if settings.ASYNC_TOGGLES else FavoriteView.as_view(),
     ),
     path(
         'recipes/<int:recipe_id>/shopping_cart/',
-        ShoppingCartViewSet.as_view(),
+        async_views.shopping_cart
+        if settings.ASYNC_TOGGLES else ShoppingCartViewSet.as_view(),
     ),
     path('', include(router.urls)),
 ]
@@ -1,47 +1,92 @@
 from django_filters.rest_framework import DjangoFilterBackend
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.permissions import (
     AllowAny,
+    IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, action
+from rest_framework.decorators import (
+    action,
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.views import APIView
-from django.db.models import Sum
 
-from recipes import models
-from api import serializers
-from api.filters import IngredientFilter, RecipeFilter
+from api import (
+    conditional,
+    serializers,
+    shopping_list,
+    toggles,
+    uploads,
+    warmup,
+)
+from api.filters import RecipeFilter
 from api.permissions import IsAuthorOrReadOnly
+from api_users.paginators import FeedPagination, KeysetPagination
 from backend import settings
+from recipes import cache, feed, ingredient_index, models
+from recipes.ingredient_index import index
 
 
-class TagView(viewsets.ModelViewSet):
+class TagView(conditional.ConditionalMixin, viewsets.ModelViewSet):
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializer
     permissions = (AllowAny,)
     pagination_class = None
 
+    def get_etag(self):
+        return conditional.make_etag('tags', cache.tags.get_version())
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.get_tags, request)
 
-class IngredientsView(viewsets.ModelViewSet):
+    def get_tags(self, request):
+        return Response(serializers.get_tag_list())
+
+
+class IngredientsView(conditional.ConditionalMixin, viewsets.ModelViewSet):
     queryset = models.Ingredient.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     serializer_class = serializers.IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filter_class = IngredientFilter
-    search_fields = ('name', )
     pagination_class = None
 
+    def get_etag(self):
+        return conditional.make_etag(
+            'ingredients', ingredient_index.get_version()
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.search, request)
+
+    def search(self, request):
+        name = request.query_params.get('name')
+        if name is None:
+            return Response(index.all())
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        limit = max(1, min(limit, settings.INGREDIENT_SEARCH_MAX_LIMIT))
+        return Response(index.search(name, limit))
+
 
 class RecipeView(viewsets.ModelViewSet):
     queryset = models.Recipe.objects.all()
     permissions = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filter_class = RecipeFilter
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
+    parser_classes = (JSONParser, MultiPartParser)
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [
+            uploads.RecipeImageUploadHandler(request)
+        ]
+        return super().initialize_request(request, *args, **kwargs)
 
     def get_serializer_class(self):
         method = self.request.method
@@ -49,6 +94,42 @@ class RecipeView(viewsets.ModelViewSet):
             return serializers.CreateRecipeSerializer
         return serializers.ShowRecipeSerializer
 
+    def get_queryset(self):
+        return super().get_queryset().defer('search_document')
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        favorites, cart = cache.get_user_flags(request.user)
+        etag = conditional.make_etag(
+            recipe.pk,
+            recipe.updated_at.isoformat(),
+            cache.get_version(),
+            recipe.pk in favorites,
+            recipe.pk in cart,
+            recipe.favorites_count,
+            recipe.in_carts_count,
+        )
+        # Last-Modified не отдаётся: счётчики, версии тегов и
+        # ингредиентов и имя автора меняют ответ без updated_at.
+        response = conditional.get_not_modified(request, etag)
+        if response is None:
+            serializer = self.get_serializer(recipe)
+            response = Response(serializer.data)
+        return conditional.set_validators(response, etag)
+
+    @action(
+        methods=('get',),
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request):
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            feed.get_recipes(request.user), request, self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({'request': self.request})
@@ -56,48 +137,13 @@ class RecipeView(viewsets.ModelViewSet):
 
 
 class FavoriteView(APIView):
-    permissions = (IsAuthenticatedOrReadOnly,)
+    permission_classes = (IsAuthenticatedOrReadOnly,)
 
-    @action(
-        methods=(
-            'post',
-        ),
-        detail=True,
-    )
     def post(self, request, recipe_id):
-        user = request.user
-        data = {
-            'user': user.id,
-            'recipe': recipe_id,
-        }
-        if models.Favorite.objects.filter(
-            user=user, recipe__id=recipe_id
-        ).exists():
-            return Response(
-                {'Ошибка': 'Уже в избранном'},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        serializer = serializers.FavoriteSerializer(
-            data=data, context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return toggles.respond(toggles.toggle_favorite, request, recipe_id)
 
-    @action(
-        methods=(
-            'DELETE',
-        ),
-        detail=True,
-    )
     def delete(self, request, recipe_id):
-        user = request.user
-        recipe = get_object_or_404(models.Recipe, id=recipe_id)
-        favorite = models.Favorite.objects.filter(user=user, recipe=recipe)
-        if not favorite.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return toggles.respond(toggles.toggle_favorite, request, recipe_id)
 
 
 class ShoppingCartViewSet(APIView):
@@ -105,72 +151,92 @@ class ShoppingCartViewSet(APIView):
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
-    @action(
-        methods=(
-            'post',
-        ),
-        detail=True,
-    )
     def post(self, request, recipe_id):
-        user = request.user
-        data = {
-            'user': user.id,
-            'recipe': recipe_id,
-        }
-        if models.ShoppingCart.objects.filter(
-                user=user, recipe__id=recipe_id
-        ).exists():
-            return Response(
-                {'Ошибка': 'Уже есть в корзине'},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        serializer = serializers.ShoppingCartSerializer(
-            data=data, context={'request': request}
+        return toggles.respond(
+            toggles.toggle_shopping_cart, request, recipe_id
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @action(
-        method=(
-            'delete',
-        ),
-        detail=True,
-    )
     def delete(self, request, recipe_id):
-        user = request.user
-        recipe = get_object_or_404(models.Recipe, id=recipe_id)
-        shoppingcart = models.ShoppingCart.objects.filter(
-            user=user, recipe=recipe
+        return toggles.respond(
+            toggles.toggle_shopping_cart, request, recipe_id
         )
-        if not shoppingcart.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        shoppingcart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkFavoriteView(APIView):
+    permission_classes = (IsAuthenticated,)
+    model = models.Favorite
+
+    def get_recipe_ids(self, request):
+        serializer = serializers.BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def respond(self, results):
+        return Response([
+            {'recipe': recipe_id, 'status': result}
+            for recipe_id, result in results.items()
+        ])
+
+    def post(self, request):
+        return self.respond(toggles.add_recipes(
+            self.model, request.user.pk, self.get_recipe_ids(request)
+        ))
+
+    def delete(self, request):
+        return self.respond(toggles.remove_recipes(
+            self.model, request.user.pk, self.get_recipe_ids(request)
+        ))
+
+
+class BulkShoppingCartView(BulkFavoriteView):
+    model = models.ShoppingCart
+
+
+@api_view(('DELETE',))
+@permission_classes((IsAuthenticated,))
+def clear_shopping_cart(request):
+    toggles.clear_recipes(models.ShoppingCart, request.user.pk)
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(('GET',))
+@permission_classes((IsAuthenticated,))
 def download_shopping_cart(request):
     user = request.user
-    if not user.shopping_cart.exists():
+    state = shopping_list.get_cart_state(user)
+    if not state['count']:
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
-    ingredients = models.IngredientInRecipe.objects.filter(
-        recipe__shopping_cart__user=request.user
-    ).values(
-        'ingredient__name',
-        'ingredient__measurement_unit'
-    ).annotate(sum_amount=Sum('amount'))
-
-    wishlist = []
-    for ingredient in ingredients:
-        name = ingredient['ingredient__name']
-        amount = ingredient['sum_amount']
-        measurement_unit = ingredient['ingredient__measurement_unit']
-        wishlist.append(
-            f"{name} - {amount} {measurement_unit}"
+    file_format = request.query_params.get('type', 'txt')
+    if file_format not in shopping_list.FORMATS:
+        formats = ', '.join(shopping_list.FORMATS)
+        return Response(
+            {'Ошибка': f'Доступные форматы: {formats}'},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-    response = HttpResponse(
-        wishlist, content_type=settings.CONTENT_TYPE_CONST
+    etag = shopping_list.get_etag(user, state, file_format)
+    response = conditional.get_not_modified(request, etag)
+    if response is not None:
+        return response
+
+    content_type, render = shopping_list.FORMATS[file_format]
+    response = StreamingHttpResponse(
+        render(shopping_list.iter_rows(user)), content_type=content_type
     )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{file_format}"'
+    )
+    response['ETag'] = etag
     return response
+
+
+@api_view(('GET',))
+@authentication_classes(())
+@permission_classes((AllowAny,))
+def readiness(request):
+    if not warmup.is_ready():
+        return Response(
+            {'status': 'warming up'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    return Response({'status': 'ready'})
@@ -0,0 +1,39 @@
+import threading
+
+from django.core.cache import caches
+from django.db import connections
+from django.urls import get_resolver
+
+from api.serializers import get_tag_list
+from recipes.ingredient_index import index
+
+ready = threading.Event()
+
+# Адреса, на которых прогревается разбор URL вложенных include.
+WARM_PATHS = (
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/recipes/',
+    '/api/users/',
+)
+
+
+def is_ready():
+    return ready.is_set()
+
+
+def run():
+    if ready.is_set():
+        return
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for path in WARM_PATHS:
+        resolver.resolve(path)
+    get_tag_list()
+    index.refresh()
+    # При preload прогрев идёт в мастере gunicorn: соединения не должны
+    # достаться воркерам после fork.
+    connections.close_all()
+    for cache in caches.all():
+        cache.close()
+    ready.set()
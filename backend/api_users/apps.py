@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiUsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api_users'
+
+    def ready(self):
+        from api_users import signals  # noqa: F401
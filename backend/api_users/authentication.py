@@ -0,0 +1,59 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.db import router
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from backend import settings
+from recipes.caching import Namespace
+
+User = get_user_model()
+
+MISSING = (None, False)
+
+tokens = Namespace('auth-token', timeout=settings.TOKEN_CACHE_TIMEOUT)
+
+
+def make_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate(keys):
+    tokens.delete_many([make_key(key) for key in keys])
+
+
+def load(model, key):
+    user = model.objects.filter(key=key).values_list(
+        'user_id', 'user__is_active'
+    ).first()
+    # Неизвестный ключ тоже кэшируется, ненадолго, чтобы поток
+    # неверных токенов не ходил в базу.
+    return user or MISSING
+
+
+def get_timeout(value):
+    if value is MISSING:
+        return settings.TOKEN_MISSING_CACHE_TIMEOUT
+    return settings.TOKEN_CACHE_TIMEOUT
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        user_id, is_active = tokens.get_or_set(
+            make_key(key), lambda: load(model, key), get_timeout
+        )
+        if user_id is None:
+            raise exceptions.AuthenticationFailed('Неверный токен')
+        if not is_active:
+            raise exceptions.AuthenticationFailed(
+                'Пользователь неактивен или удалён'
+            )
+        # В кэше только ключ -> (id пользователя, is_active). Остальные
+        # поля отложены: они читаются из базы при первом обращении, а
+        # save() записывает только загруженные и изменённые поля, так
+        # что устаревшая строка не попадёт обратно в базу.
+        user = User.from_db(router.db_for_read(User), ('id',), (user_id,))
+        return user, model(key=key, user=user)
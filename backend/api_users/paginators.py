@@ -1,6 +1,185 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
 from backend import settings
 
 
 class CustomPagination(PageNumberPagination):
     page_size = settings.PAGINATOR_CONST
+
+
+class KeysetPagination(CustomPagination):
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор'
+    unordered_cursor_message = (
+        'Курсор недоступен для этой сортировки, используйте page'
+    )
+
+    cursor_mode = False
+    cursor_only = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            not self.cursor_only
+            and self.cursor_query_param not in request.query_params
+        ):
+            return super().paginate_queryset(queryset, request, view)
+        # Курсор хранит позицию по self.ordering и не подходит выдаче
+        # со своим порядком, например поиску по релевантности.
+        if not self.cursor_only and queryset.query.order_by and tuple(
+            queryset.query.order_by
+        ) != tuple(self.ordering):
+            raise NotFound(self.unordered_cursor_message)
+        self.cursor_mode = True
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, '')
+        )
+
+        self.count = None
+        if request.query_params.get(self.count_query_param):
+            self.count = self.get_count(queryset)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self.invert(field) for field in ordering)
+        try:
+            results = self.get_results(
+                queryset, ordering, position, page_size + 1
+            )
+        except (ValidationError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        self.next_position = None
+        self.previous_position = None
+        if results and has_next:
+            self.next_position = self.get_position(results[-1])
+        if results and has_previous:
+            self.previous_position = self.get_position(results[0])
+        return results
+
+    def get_count(self, queryset):
+        return queryset.count()
+
+    def get_results(self, queryset, ordering, position, limit):
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+        return list(queryset[:limit])
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.make_link(False, self.next_position)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if self.previous_position is None:
+            return None
+        return self.make_link(True, self.previous_position)
+
+    def make_link(self, reverse, position):
+        url = remove_query_param(self.base_url, self.count_query_param)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(reverse, position),
+        )
+
+    def get_position(self, obj):
+        return [
+            str(getattr(obj, field.lstrip('-'))) for field in self.ordering
+        ]
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def keyset_filter(ordering, position):
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        # Избыточная граница по первому полю даёт индексу условие
+        # начала диапазона, из OR его планировщик не выводит.
+        field, value = ordering[0], position[0]
+        lookup = 'lte' if field.startswith('-') else 'gte'
+        return Q(**{f'{field.lstrip("-")}__{lookup}': value}) & condition
+
+    def encode_cursor(self, reverse, position):
+        data = json.dumps({'r': int(reverse), 'p': position})
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return False, None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            reverse = bool(data['r'])
+            position = [str(value) for value in data['p']]
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+
+class FeedPagination(KeysetPagination):
+    ordering = ('-feed_pub_date', '-feed_recipe_id')
+    cursor_only = True
+
+    def get_count(self, querysets):
+        return sum(queryset.count() for queryset in querysets)
+
+    def get_results(self, querysets, ordering, position, limit):
+        return list(self.get_page(querysets, ordering, position, limit))
+
+    def get_page(self, querysets, ordering, position, limit):
+        # Граница курсора ставится в каждую ветку, чтобы они читались
+        # с нужного места своих индексов. Порядок задаётся только
+        # у объединения.
+        querysets = [queryset.order_by() for queryset in querysets]
+        if position is not None:
+            querysets = [
+                queryset.filter(self.keyset_filter(ordering, position))
+                for queryset in querysets
+            ]
+        first, *rest = querysets
+        return first.union(*rest, all=True).order_by(*ordering)[:limit]
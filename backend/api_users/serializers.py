@@ -1,10 +1,13 @@
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from rest_framework.authtoken.models import Token
 
-from users import models
+from backend import settings
+from recipes import images
 from recipes.models import Recipe
+from users import models
 
 
 User = get_user_model()
@@ -16,6 +19,15 @@ class CustomUserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'first_name', 'last_name')
 
 
+class ShowUserSerializer(CustomUserSerializer):
+    # Счётчики не входят в CustomUserSerializer: он вложен в кэшируемое
+    # содержимое рецепта и устарел бы там.
+    class Meta(CustomUserSerializer.Meta):
+        fields = CustomUserSerializer.Meta.fields + (
+            'recipes_count', 'followers_count'
+        )
+
+
 class PasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(required=True)
     current_password = serializers.CharField(required=True)
@@ -26,6 +38,8 @@ class PasswordSerializer(serializers.Serializer):
 
 
 class SpecialRecipeSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField('get_image')
+
     class Meta:
         model = Recipe
         fields = (
@@ -35,6 +49,21 @@ class SpecialRecipeSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def get_image(self, obj):
+        if not obj.image:
+            return None
+        url = default_storage.url(
+            images.get_variant(
+                obj.image.name,
+                obj.image_variants,
+                settings.LIST_IMAGE_VARIANT,
+            )
+        )
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
 
 class TokenSerializer(serializers.ModelSerializer):
     token = serializers.CharField(source='key')
@@ -73,7 +102,6 @@ class FollowerSerializer(serializers.ModelSerializer):
 class ShowFollowerSerializer(serializers.ModelSerializer):
     recipes = SpecialRecipeSerializer(many=True, required=True)
     is_subscribed = serializers.SerializerMethodField('check_if_is_subscribed')
-    recipes_count = serializers.SerializerMethodField('get_recipes_count')
 
     class Meta:
         model = User
@@ -86,15 +114,15 @@ class ShowFollowerSerializer(serializers.ModelSerializer):
             'is_subscribed',
             'recipes',
             'recipes_count',
+            'followers_count',
         )
 
     def check_if_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
         return models.Follow.objects.filter(
             user=request.user, following=obj
         ).exists()
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.all().count()
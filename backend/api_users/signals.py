@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api_users import authentication
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    keys = (instance.key,)
+    transaction.on_commit(lambda: authentication.invalidate(keys))
+
+
+# Поля пользователя, которые хранятся в кэше токенов.
+TOKEN_USER_FIELDS = {'is_active'}
+
+
+@receiver(post_save, sender=User)
+def token_user_changed(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    if created:
+        return
+    if update_fields and not TOKEN_USER_FIELDS.intersection(update_fields):
+        return
+    if not instance.has_changed(TOKEN_USER_FIELDS):
+        return
+    keys = list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    if keys:
+        transaction.on_commit(lambda: authentication.invalidate(keys))
@@ -0,0 +1,192 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api_users.paginators import KeysetPagination
+from backend import settings
+from recipes.models import Recipe
+from users.models import Follow, User
+
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CountersSaveTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        self.follower = User.objects.create_user(
+            email='follower@example.com', username='follower', password='pass'
+        )
+
+    def test_set_password_keeps_followers_count(self):
+        # Объект автора прочитан до подписки и держит старый счётчик.
+        author = User.objects.get(pk=self.author.pk)
+        client = APIClient()
+        client.force_authenticate(self.follower)
+        response = client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+        client = APIClient()
+        client.force_authenticate(author)
+        response = client.post(
+            '/api/users/set_password/',
+            {'new_password': 'new-pass', 'current_password': 'pass'},
+        )
+        self.assertEqual(response.status_code, 200)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.assertTrue(author.check_password('new-pass'))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_user_is_read_fresh(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(first_name='Новое')
+        response = self.client.post(
+            '/api/users/set_password/',
+            {'new_password': 'new-pass', 'current_password': 'pass'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Новое')
+        self.assertTrue(self.user.check_password('new-pass'))
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.json()['first_name'], 'Новое')
+
+    def test_unknown_token_is_cached(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + 'a' * 40)
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get('/api/users/me/').status_code, 401)
+        self.assertEqual(len(queries), 0)
+
+    def test_logout_evicts_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_deactivation_evicts_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_other_changes_keep_cached_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Имя'
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/users/me/')
+        # Только чтение пользователя в самом представлении.
+        self.assertEqual(len(queries), 1)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def test_recipes(self):
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=self.user,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=1,
+                image='recipe.png',
+            )
+            for number in range(settings.PAGINATOR_CONST * 2 + 1)
+        ])
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+
+        pages = self.walk('/api/recipes/?cursor=&count=1')
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[0]['count'], len(expected))
+        self.assertIsNone(pages[0]['previous'])
+        self.assertEqual(
+            [recipe['id'] for page in pages for recipe in page['results']],
+            expected,
+        )
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+        response = self.client.get('/api/recipes/?page=3')
+        self.assertEqual(response.data['count'], len(expected))
+        self.assertEqual(response.data['results'], pages[-1]['results'])
+
+    def test_subscriptions(self):
+        authors = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}',
+                password='pass',
+            )
+            for number in range(settings.PAGINATOR_CONST + 1)
+        ]
+        for author in authors:
+            Follow.objects.create(user=self.user, following=author)
+
+        pages = self.walk('/api/users/subscriptions/?cursor=')
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(
+            [user['id'] for page in pages for user in page['results']],
+            [author.pk for author in authors],
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in ('bad', 'e30='):
+            response = self.client.get(f'/api/recipes/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404)
+
+    def test_cursor_rejects_other_ordering(self):
+        request = Request(APIRequestFactory().get('/', {'cursor': ''}))
+        with self.assertRaises(NotFound):
+            KeysetPagination().paginate_queryset(
+                Recipe.objects.order_by('name'), request
+            )
@@ -2,7 +2,9 @@ from django.urls import path
 from django.conf.urls import include
 from rest_framework.routers import DefaultRouter
 
+from api import async_views
 from api_users.views import CustomUserViewSet
+from backend import settings
 
 router = DefaultRouter()
 router.register('users', CustomUserViewSet)
@@ -11,3 +13,8 @@ urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_TOGGLES:
+    urlpatterns.insert(
+        0, path('users/<int:pk>/subscribe/', async_views.subscribe)
+    )
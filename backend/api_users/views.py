@@ -1,29 +1,67 @@
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.hashers import make_password
+from django.db.models import (
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value,
+    prefetch_related_objects,
+)
 from rest_framework import status, viewsets
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import (
     IsAuthenticated,
     AllowAny,
 )
-from api_users.paginators import CustomPagination
+from api_users.paginators import KeysetPagination
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from api_users.serializers import (
-    CustomUserSerializer,
     PasswordSerializer,
     ShowFollowerSerializer,
-    FollowerSerializer,
+    ShowUserSerializer,
 )
-from users.models import Follow
+from api import toggles
+from recipes.models import Recipe
 
 User = get_user_model()
 
 
+def get_subscriptions(user):
+    return User.objects.filter(following__user=user).annotate(
+        follow_id=F('following__id'),
+        is_subscribed=Value(True),
+    ).order_by('follow_id')
+
+
+def get_subscription_recipes(recipes_limit=None):
+    recipes = Recipe.objects.only(
+        'id',
+        'name',
+        'image',
+        'image_variants',
+        'cooking_time',
+        'author_id',
+    ).order_by('-pub_date', '-id')
+    if recipes_limit is None:
+        return recipes
+    return recipes.filter(
+        pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).order_by('-pub_date', '-id').values('pk')[
+                :max(recipes_limit, 0)
+            ]
+        )
+    )
+
+
 class CustomUserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
-    serializer_class = CustomUserSerializer
+    serializer_class = ShowUserSerializer
     permission_classes = (
         AllowAny,
     )
@@ -34,7 +72,7 @@ class CustomUserViewSet(viewsets.ModelViewSet):
     )
     def me(self, request, *args, **kwargs):
         user = get_object_or_404(User, pk=request.user.id)
-        serializer = CustomUserSerializer(user)
+        serializer = ShowUserSerializer(user)
         return Response(serializer.data)
 
     def perform_create(self, serializer):
@@ -66,25 +104,11 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscribe(self, request, pk=None):
-        user = request.user
-        following = get_object_or_404(User, pk=pk)
-        follow = Follow.objects.filter(user=user, following=following)
-        data = {
-            'user': user.id,
-            'following': following.id,
-        }
-        if request.method == 'GET' or request.method == 'POST':
-            if follow.exists():
-                return Response(
-                    'Вы уже подписаны', status=status.HTTP_400_BAD_REQUEST
-                )
-            serializer = FollowerSerializer(data=data, context=request)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        elif request.method == 'DELETE':
-            follow.delete()
-            return Response('Удалено', status=status.HTTP_204_NO_CONTENT)
+        try:
+            following_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        return toggles.respond(toggles.toggle_subscribe, request, following_id)
 
     @action(
         methods=('get', 'post'),
@@ -92,14 +116,24 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
-        user = request.user
-        follow = Follow.objects.filter(user=user)
-        user_obj = []
-        for follow_obj in follow:
-            user_obj.append(follow_obj.following)
-        paginator = CustomPagination()
-        result_page = paginator.paginate_queryset(user_obj, request)
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is not None:
+            try:
+                recipes_limit = int(recipes_limit)
+            except ValueError:
+                return Response(
+                    {'recipes_limit': 'Должно быть целым числом'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        recipes = get_subscription_recipes(recipes_limit)
+        queryset = get_subscriptions(request.user)
+        paginator = KeysetPagination()
+        paginator.ordering = ('follow_id',)
+        result_page = paginator.paginate_queryset(queryset, request)
+        prefetch_related_objects(
+            result_page, Prefetch('recipes', queryset=recipes)
+        )
         serializer = ShowFollowerSerializer(
-            result_page, many=True, context={'current_user': user}
+            result_page, many=True, context={'request': request}
         )
         return paginator.get_paginated_response(serializer.data)
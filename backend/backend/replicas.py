@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+from backend import settings
+
+COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+state = contextvars.ContextVar('replica_state', default=None)
+
+
+class State:
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def get_replicas():
+    return [alias for alias in connections if alias != DEFAULT_DB_ALIAS]
+
+
+def written():
+    current = state.get()
+    if current is not None:
+        current.pinned = current.wrote = True
+
+
+@contextmanager
+def use_primary():
+    # Значения для общего кэша читаем с основной базы, иначе отставшая
+    # реплика вернёт в кэш данные, которые только что инвалидировали.
+    current = state.get()
+    if current is None or current.pinned:
+        yield
+        return
+    current.pinned = True
+    try:
+        yield
+    finally:
+        current.pinned = False
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        current = state.get()
+        # Вне запроса (команды, фоновые задачи после commit) и после
+        # записи читаем с основной базы: реплика может отставать.
+        if (
+            current is None
+            or current.pinned
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        written()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики совпадает с основной базой. Рабочую реплику
+        # migrate не трогает без --database, а отдельной тестовой
+        # базе реплики нужны те же таблицы.
+        return True
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    # process_request/process_response из MiddlewareMixin в ASGI
+    # выполнялись бы в отдельном потоке, поэтому __call__ свой.
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        current = self.start(request)
+        token = state.set(current)
+        try:
+            response = self.get_response(request)
+        finally:
+            state.reset(token)
+        return self.finish(current, response)
+
+    async def __acall__(self, request):
+        current = self.start(request)
+        token = state.set(current)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state.reset(token)
+        return self.finish(current, response)
+
+    def start(self, request):
+        if request.method not in SAFE_METHODS:
+            return State(pinned=True)
+        try:
+            pinned_until = float(request.COOKIES.get(COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        return State(pinned=pinned_until > time.time())
+
+    def finish(self, current, response):
+        # Запрос, который писал, закрепляет клиента за основной базой,
+        # пока реплика не догонит: следующие чтения увидят запись.
+        if current.wrote:
+            response.set_cookie(
+                COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
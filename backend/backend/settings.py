@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     'rest_framework',
     'rest_framework.authtoken',
@@ -69,6 +70,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Асинхронные переключатели избранного, корзины и подписок (под ASGI).
+ASYNC_TOGGLES = os.getenv('ASYNC_TOGGLES') == 'True'
+
+# Потоки ASGI-воркера для запросов переключателей к БД. Каждый поток
+# держит своё соединение.
+ASYNC_TOGGLE_THREADS = int(os.getenv('ASYNC_TOGGLE_THREADS', 4))
+
 
 DATABASES = {
     'default': {
@@ -77,13 +85,55 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+        ),
+        # Для pgbouncer в режиме transaction pooling.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER') == 'True',
+    }
+}
+
+# Соединение, простоявшее без запросов дольше этого времени, перед
+# использованием проверяется запросом SELECT 1 (при CONN_HEALTH_CHECKS).
+DB_HEALTH_CHECK_IDLE_SECONDS = int(
+    os.getenv('DB_HEALTH_CHECK_IDLE_SECONDS', 30)
+)
+
+# Как часто воркер переносит счётчики соединений из памяти в кэш.
+DB_STATS_FLUSH_SECONDS = 10
+
+# Реплика для чтения. Без DB_REPLICA_HOST и DB_REPLICA_NAME всё
+# работает только с default. Тесты создают для реплики отдельную базу
+# (не зеркало default), чтобы чтение не с той базы было заметно.
+if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    }
+    DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+    MIDDLEWARE.insert(0, 'backend.replicas.ReplicaMiddleware')
+
+# Сколько секунд после записи клиент читает с основной базы.
+REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram-cache'),
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'foodgram'),
     }
 }
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api_users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': [
         'rest_framework.pagination.PageNumberPagination',
@@ -143,4 +193,68 @@ MIN_COOKING_TIME = 1
 
 PAGINATOR_CONST = 6
 
-CONTENT_TYPE_CONST = 'text/plain'
+CONTENT_TYPE_CONST = 'text/plain; charset=utf-8'
+
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+
+USER_FLAGS_CACHE_TIMEOUT = 60 * 60
+
+TOKEN_CACHE_TIMEOUT = 60
+
+# Сколько помнить, что такого токена нет.
+TOKEN_MISSING_CACHE_TIMEOUT = 5
+
+CACHE_LOCK_TIMEOUT = 10
+
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', 100))
+
+RECIPE_SEARCH_FALLBACK_LIMIT = 200
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+# Индекс поиска в памяти догоняет до стольких версий по журналу
+# изменений, при большем отставании собирается заново.
+RECIPE_SEARCH_MAX_CHANGES = 1000
+
+RECIPE_SEARCH_CHANGES_TIMEOUT = 60 * 60
+
+IMAGE_VARIANTS = {
+    'thumbnail': (480, 480),
+    'detail': (1200, 1200),
+}
+
+LIST_IMAGE_VARIANT = 'thumbnail'
+
+DETAIL_IMAGE_VARIANT = 'detail'
+
+IMAGE_VARIANTS_DIR = 'recipes/variants'
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Рецепты авторов с большим числом подписчиков не раскладываются
+# по лентам, а подмешиваются при чтении.
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 10000)
+)
+
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', 500))
+
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', 2))
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+RECIPE_UPLOAD_MAX_SIZE = RECIPE_IMAGE_MAX_SIZE + 1024 * 1024
+
+RECIPE_IMAGE_MAX_DIMENSION = 8000
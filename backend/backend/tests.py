@@ -0,0 +1,107 @@
+import time
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from backend import replicas
+from recipes.models import Recipe
+from users.models import User
+
+REPLICA = 'replica'
+
+
+# Реплика в тестах - отдельная пустая база, поэтому чтение не с той
+# базы сразу видно по результату.
+@skipUnless(
+    REPLICA in settings.DATABASES,
+    'Нужна реплика: DB_REPLICA_NAME или DB_REPLICA_HOST',
+)
+class ReplicaRouterTest(TransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.router = replicas.ReplicaRouter()
+
+    def request_state(self, pinned=False):
+        state = replicas.State(pinned=pinned)
+        token = replicas.state.set(state)
+        self.addCleanup(replicas.state.reset, token)
+        return state
+
+    def test_reads_go_to_replica(self):
+        self.request_state()
+        self.assertEqual(self.router.db_for_read(User), REPLICA)
+        self.assertFalse(User.objects.exists())
+
+    def test_reads_outside_request_go_to_default(self):
+        self.assertEqual(self.router.db_for_read(User), DEFAULT_DB_ALIAS)
+        self.assertTrue(User.objects.exists())
+
+    def test_writes_go_to_default_and_pin(self):
+        state = self.request_state()
+        self.assertEqual(self.router.db_for_write(User), DEFAULT_DB_ALIAS)
+        User.objects.create(email='new@example.com', username='new')
+        self.assertTrue(state.pinned)
+        self.assertTrue(state.wrote)
+        self.assertTrue(User.objects.filter(username='new').exists())
+        self.assertFalse(
+            User.objects.using(REPLICA).filter(username='new').exists()
+        )
+
+    def test_use_primary(self):
+        state = self.request_state()
+        with replicas.use_primary():
+            self.assertEqual(
+                self.router.db_for_read(User), DEFAULT_DB_ALIAS
+            )
+            self.assertTrue(User.objects.exists())
+        self.assertFalse(state.pinned)
+        self.assertFalse(User.objects.exists())
+
+    def test_get_reads_replica(self):
+        response = APIClient().get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        self.assertNotIn(replicas.COOKIE, response.cookies)
+
+    def test_pinned_get_reads_default(self):
+        client = APIClient()
+        client.cookies[replicas.COOKIE] = str(time.time() + 60)
+        response = client.get('/api/users/')
+        self.assertEqual(
+            [user['id'] for user in response.json()], [self.user.pk]
+        )
+
+    def test_expired_pin_reads_replica(self):
+        client = APIClient()
+        client.cookies[replicas.COOKIE] = str(time.time() - 1)
+        self.assertEqual(client.get('/api/users/').json(), [])
+
+    def test_write_request_sets_pin(self):
+        # bulk_create не запускает фоновую нарезку изображения.
+        Recipe.objects.bulk_create([Recipe(
+            author=self.user,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=1,
+            image='recipe.png',
+        )])
+        recipe = Recipe.objects.get(author=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(replicas.COOKIE, response.cookies)
+        # Клиент с cookie читает свою запись с основной базы.
+        response = client.get('/api/users/')
+        self.assertEqual(
+            [user['id'] for user in response.json()], [self.user.pk]
+        )
@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+
+ASYNC_WORKERS = ('uvicorn.workers.UvicornWorker',)
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+
+# Асинхронному воркеру хватает одного процесса на ядро: ожидание базы
+# он переносит в свой пул из ASYNC_TOGGLE_THREADS потоков, так что
+# одновременных запросов к базе у него столько же, сколько потоков.
+# Синхронным воркерам нужен запас процессов на время ожидания базы.
+if worker_class in ASYNC_WORKERS:
+    default_workers = multiprocessing.cpu_count()
+else:
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv('GUNICORN_WORKERS', default_workers))
+
+# Приложение импортируется и прогревается в мастере один раз, воркеры
+# получают готовые модули и индексы через copy-on-write.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Перезапуск воркеров ограничивает рост памяти, разброс не даёт им
+# перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+
+
+def when_ready(server):
+    if preload_app:
+        from api import warmup
+        warmup.run()
+
+
+def post_worker_init(worker):
+    # Без preload каждый воркер прогревается сам, с preload здесь
+    # ничего не делается: прогрев унаследован от мастера.
+    from api import warmup
+    warmup.run()
@@ -0,0 +1,61 @@
+from backend import settings
+from recipes import models
+from recipes.caching import Namespace
+
+recipes = Namespace('recipe', timeout=settings.RECIPE_CACHE_TIMEOUT)
+tags = Namespace('tags')
+user_flags = Namespace(
+    'user-flags', timeout=settings.USER_FLAGS_CACHE_TIMEOUT
+)
+
+
+def get_version():
+    return recipes.get_version()
+
+
+def bump_version():
+    recipes.bump_version()
+
+
+def get_many(recipe_ids):
+    return recipes.get_many(recipe_ids)
+
+
+def set_many(payloads):
+    recipes.set_many(payloads)
+
+
+def invalidate(recipe_ids):
+    recipes.delete_many(recipe_ids)
+
+
+def get_stats():
+    return recipes.get_stats()
+
+
+def reset_stats():
+    recipes.reset_stats()
+
+
+def get_user_flags(user):
+    if user.is_anonymous:
+        return frozenset(), frozenset()
+    return user_flags.get_or_set_checked(
+        user.pk,
+        lambda: (
+            frozenset(
+                models.Favorite.objects.filter(user=user).values_list(
+                    'recipe_id', flat=True
+                )
+            ),
+            frozenset(
+                models.ShoppingCart.objects.filter(user=user).values_list(
+                    'recipe_id', flat=True
+                )
+            ),
+        ),
+    )
+
+
+def invalidate_user_flags(user_ids):
+    user_flags.invalidate_many(user_ids)
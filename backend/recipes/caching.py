@@ -0,0 +1,152 @@
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from backend import replicas, settings
+
+MISSING = object()
+
+
+class Namespace:
+    registry = {}
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self.version_key = f'{name}:version'
+        self.hits_key = f'{name}:stats:hits'
+        self.misses_key = f'{name}:stats:misses'
+        Namespace.registry[name] = self
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # Начальное значение от времени, чтобы после очистки кэша
+            # версии и ETag не совпали с выданными ранее.
+            cache.add(self.version_key, int(time.time() * 1000), None)
+            version = cache.get(self.version_key, 0)
+        return version
+
+    def bump_version(self):
+        try:
+            return cache.incr(self.version_key)
+        except ValueError:
+            return self.get_version()
+
+    def make_key(self, key, version):
+        return f'{self.name}:{version}:{key}'
+
+    def get_many(self, keys):
+        version = self.get_version()
+        full_keys = {self.make_key(key, version): key for key in keys}
+        found = cache.get_many(full_keys)
+        values = {full_keys[key]: value for key, value in found.items()}
+        self.count(len(values), len(full_keys) - len(values))
+        return values
+
+    def set_many(self, values):
+        version = self.get_version()
+        cache.set_many(
+            {
+                self.make_key(key, version): value
+                for key, value in values.items()
+            },
+            self.timeout,
+        )
+
+    def delete_many(self, keys):
+        version = self.get_version()
+        cache.delete_many([self.make_key(key, version) for key in keys])
+
+    def get_or_set(self, key, compute, get_timeout=None):
+        full_key = self.make_key(key, self.get_version())
+        value = cache.get(full_key, MISSING)
+        if value is not MISSING:
+            self.count(1, 0)
+            return value
+        self.count(0, 1)
+        # Значение пересчитывает только тот, кто взял блокировку,
+        # остальные ждут его результата. Блокировка надёжна только
+        # с атомарным add (Redis, memcached): у FileBasedCache add
+        # и incr не атомарны, и пересчитать могут несколько процессов.
+        lock_key = f'{full_key}:lock'
+        if cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+            try:
+                with replicas.use_primary():
+                    value = compute()
+                timeout = self.timeout
+                if get_timeout is not None:
+                    timeout = get_timeout(value)
+                cache.set(full_key, value, timeout)
+            finally:
+                cache.delete(lock_key)
+            return value
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+            found = cache.get_many((full_key, lock_key))
+            if full_key in found:
+                return found[full_key]
+            # Блокировка снята, а значения нет: вычисление упало. Ждать
+            # дальше бессмысленно, ожидающий считает сам.
+            if lock_key not in found:
+                break
+        with replicas.use_primary():
+            return compute()
+
+    def make_item_version_key(self, key):
+        return f'{self.name}:item-version:{key}'
+
+    def get_or_set_checked(self, key, compute):
+        # Значение хранится вместе с версией своего ключа, прочитанной
+        # до вычисления. Если invalidate_many сработал во время
+        # вычисления, записанное значение окажется под старой версией
+        # и не будет прочитано.
+        full_key = self.make_key(key, self.get_version())
+        version_key = self.make_item_version_key(key)
+        found = cache.get_many((full_key, version_key))
+        version = found.get(version_key)
+        if version is None:
+            cache.add(version_key, int(time.time() * 1000), None)
+            version = cache.get(version_key, 0)
+        stored = found.get(full_key)
+        if stored is not None and stored[0] == version:
+            self.count(1, 0)
+            return stored[1]
+        self.count(0, 1)
+        with replicas.use_primary():
+            value = compute()
+        cache.set(full_key, (version, value), self.timeout)
+        return value
+
+    def invalidate_many(self, keys):
+        for key in keys:
+            version_key = self.make_item_version_key(key)
+            try:
+                cache.incr(version_key)
+            except ValueError:
+                cache.add(version_key, int(time.time() * 1000), None)
+
+    def count(self, hits, misses):
+        for key, delta in ((self.hits_key, hits), (self.misses_key, misses)):
+            if not delta:
+                continue
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                cache.set(key, delta, None)
+
+    def get_stats(self):
+        stats = cache.get_many((self.hits_key, self.misses_key))
+        hits = stats.get(self.hits_key, 0)
+        misses = stats.get(self.misses_key, 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'ratio': round(hits / total, 4) if total else None,
+        }
+
+    def reset_stats(self):
+        cache.delete_many((self.hits_key, self.misses_key))
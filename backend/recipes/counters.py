@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes import models
+from users.models import Follow
+
+User = get_user_model()
+
+# Связь -> (модель со счётчиком, внешний ключ на неё, поле счётчика).
+COUNTERS = {
+    models.Favorite: (models.Recipe, 'recipe_id', 'favorites_count'),
+    models.ShoppingCart: (models.Recipe, 'recipe_id', 'in_carts_count'),
+    Follow: (User, 'following_id', 'followers_count'),
+    models.Recipe: (User, 'author_id', 'recipes_count'),
+}
+
+
+def change_many(model, target_ids, delta):
+    target, _, field = COUNTERS[model]
+    # UPDATE ... SET field = field + delta не теряет параллельные
+    # изменения. Greatest не даёт уйти ниже нуля счётчику, который уже
+    # разошёлся с данными.
+    target.objects.filter(pk__in=target_ids).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def change(model, target_id, delta):
+    change_many(model, (target_id,), delta)
+
+
+def instance_changed(instance, delta):
+    model = type(instance)
+    change(model, getattr(instance, COUNTERS[model][1]), delta)
+
+
+def release(model, rows):
+    # Уменьшает счётчики сразу на все удаляемые строки связи одной
+    # командой UPDATE с числом строк на каждую цель.
+    target, key, field = COUNTERS[model]
+    removed = Subquery(
+        rows.filter(**{key: OuterRef('pk')}).order_by().values(key).annotate(
+            count=Count('pk')
+        ).values('count')
+    )
+    return target.objects.filter(pk__in=rows.values(key)).update(
+        **{field: Greatest(F(field) - removed, 0)}
+    )
+
+
+def get_actual(model):
+    _, key, _ = COUNTERS[model]
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{key: OuterRef('pk')}).order_by().values(
+                key
+            ).annotate(count=Count('pk')).values('count')
+        ),
+        0,
+    )
+
+
+def reconcile(model, target_ids):
+    target, _, field = COUNTERS[model]
+    actual = get_actual(model)
+    return target.objects.filter(pk__in=target_ids).exclude(
+        **{field: actual}
+    ).update(**{field: actual})
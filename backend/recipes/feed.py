@@ -0,0 +1,141 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection
+from django.db.models import Exists, F, OuterRef
+
+from backend import settings
+from recipes import models
+from users.models import Follow
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.FEED_WORKERS, thread_name_prefix='feed'
+)
+
+TIMELINE = models.TimelineEntry._meta.db_table
+RECIPES = models.Recipe._meta.db_table
+USERS = models.User._meta.db_table
+FOLLOWS = Follow._meta.db_table
+
+
+def fan_out(recipe_id):
+    # Одна команда INSERT ... SELECT по всем подписчикам автора.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TIMELINE} (user_id, recipe_id, pub_date) '
+            f'SELECT f.user_id, r.id, r.pub_date FROM {RECIPES} r '
+            f'JOIN {USERS} a ON a.id = r.author_id '
+            f'JOIN {FOLLOWS} f ON f.following_id = r.author_id '
+            f'WHERE r.id = %s AND a.followers_count <= %s '
+            f'ON CONFLICT DO NOTHING',
+            (recipe_id, settings.FEED_FANOUT_MAX_FOLLOWERS),
+        )
+        return cursor.rowcount
+
+
+def fan_out_in_background(recipe_id):
+    def run():
+        try:
+            fan_out(recipe_id)
+        except Exception:
+            logger.exception(
+                'Не удалось разложить рецепт %s по лентам', recipe_id
+            )
+        finally:
+            close_old_connections()
+
+    executor.submit(run)
+
+
+def fan_out_recent(since):
+    # Задачи пула живут в памяти воркера и пропадают при его
+    # перезапуске, поэтому недавние рецепты периодически раскладываются
+    # повторно. Уже созданные записи не дублируются.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TIMELINE} (user_id, recipe_id, pub_date) '
+            f'SELECT f.user_id, r.id, r.pub_date FROM {RECIPES} r '
+            f'JOIN {USERS} a ON a.id = r.author_id '
+            f'JOIN {FOLLOWS} f ON f.following_id = r.author_id '
+            f'WHERE r.pub_date >= %s AND a.followers_count <= %s '
+            f'ON CONFLICT DO NOTHING',
+            (since, settings.FEED_FANOUT_MAX_FOLLOWERS),
+        )
+        return cursor.rowcount
+
+
+def backfill(user_id, author_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TIMELINE} (user_id, recipe_id, pub_date) '
+            f'SELECT %s, r.id, r.pub_date FROM {RECIPES} r '
+            f'JOIN {USERS} a ON a.id = r.author_id '
+            f'WHERE r.author_id = %s AND a.followers_count <= %s '
+            f'ORDER BY r.pub_date DESC, r.id DESC LIMIT %s '
+            f'ON CONFLICT DO NOTHING',
+            (
+                user_id,
+                author_id,
+                settings.FEED_FANOUT_MAX_FOLLOWERS,
+                settings.FEED_BACKFILL_LIMIT,
+            ),
+        )
+        return cursor.rowcount
+
+
+def prune(user_id, author_id):
+    return models.TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()[0]
+
+
+def rebuild(user_ids):
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        cursor.execute(
+            f'INSERT INTO {TIMELINE} (user_id, recipe_id, pub_date) '
+            f'SELECT f.user_id, r.id, r.pub_date FROM {FOLLOWS} f '
+            f'JOIN {USERS} a ON a.id = f.following_id '
+            f'JOIN {RECIPES} r ON r.author_id = f.following_id '
+            f'WHERE f.user_id IN ({placeholders}) '
+            f'AND a.followers_count <= %s '
+            f'ON CONFLICT DO NOTHING',
+            (*user_ids, settings.FEED_FANOUT_MAX_FOLLOWERS),
+        )
+        return cursor.rowcount
+
+
+def get_recipes(user):
+    # Записи ленты пользователя и рецепты крупных авторов, на которых он
+    # подписан, - одним запросом UNION ALL. Ветки упорядочены по своим
+    # индексам, поэтому страница читается слиянием их диапазонов.
+    timeline = models.Recipe.objects.filter(
+        timeline_entries__user=user
+    ).annotate(
+        feed_pub_date=F('timeline_entries__pub_date'),
+        feed_recipe_id=F('timeline_entries__recipe_id'),
+    )
+    # Рецепты таких авторов не раскладываются при публикации, а
+    # выбираются по индексу (author, -pub_date, -id). Записи, попавшие
+    # в ленту до того, как автор стал крупным, уже есть в первой ветке.
+    large_authors = models.Recipe.objects.filter(
+        author__in=Follow.objects.filter(
+            user=user,
+            following__followers_count__gt=(
+                settings.FEED_FANOUT_MAX_FOLLOWERS
+            ),
+        ).values('following_id'),
+    ).exclude(
+        Exists(models.TimelineEntry.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+    ).annotate(
+        feed_pub_date=F('pub_date'),
+        feed_recipe_id=F('id'),
+    )
+    return [
+        queryset.defer('search_document')
+        for queryset in (timeline, large_authors)
+    ]
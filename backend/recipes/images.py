@@ -0,0 +1,152 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from backend import settings
+from recipes import cache, models
+
+logger = logging.getLogger(__name__)
+
+FORMATS = (
+    ('jpeg', 'JPEG', 'jpg', {'quality': 85, 'optimize': True}),
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 6}),
+    ('avif', 'AVIF', 'avif', {'quality': 60}),
+)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='images'
+)
+
+
+def get_formats():
+    Image.init()
+    return [item for item in FORMATS if item[1] in Image.SAVE]
+
+
+def needs_variants(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') != recipe.image.name
+    )
+
+
+def get_variants_dir(recipe_id):
+    return f'{settings.IMAGE_VARIANTS_DIR}/{recipe_id}/'
+
+
+def save_variant(recipe, image, size, image_format, extension, params):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, image_format, **params)
+    content = buffer.getvalue()
+    # Копии разных изображений не делят файлы, и старые копии можно
+    # удалять, не проверяя, нужны ли они кому-то ещё.
+    digest = hashlib.sha256(recipe.image.name.encode())
+    digest.update(content)
+    name = (
+        f'{get_variants_dir(recipe.pk)}{digest.hexdigest()[:20]}.{extension}'
+    )
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def build_variants(recipe):
+    with recipe.image.open('rb') as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image = image.convert('RGB')
+    variants = {'source': recipe.image.name}
+    for variant, size in settings.IMAGE_VARIANTS.items():
+        variants[variant] = {
+            key: save_variant(
+                recipe, image, size, image_format, extension, params
+            )
+            for key, image_format, extension, params in get_formats()
+        }
+    return variants
+
+
+def get_variant_names(recipe_id, variants):
+    # Копии из общего каталога, созданные до разделения по рецептам,
+    # могут принадлежать нескольким рецептам и не удаляются.
+    prefix = get_variants_dir(recipe_id)
+    return {
+        name
+        for variant, formats in variants.items() if variant != 'source'
+        for name in formats.values()
+        if name.startswith(prefix)
+    }
+
+
+def delete_variants(recipe_id, variants, keep=None):
+    names = get_variant_names(recipe_id, variants)
+    if keep:
+        names -= get_variant_names(recipe_id, keep)
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.exception('Не удалось удалить копию изображения %s', name)
+
+
+def delete_variants_on_commit(recipe_id, variants, keep=None):
+    if get_variant_names(recipe_id, variants):
+        transaction.on_commit(
+            lambda: delete_variants(recipe_id, variants, keep)
+        )
+
+
+def generate(recipe_id):
+    recipe = models.Recipe.objects.filter(pk=recipe_id).only(
+        'pk', 'image', 'image_variants'
+    ).first()
+    if recipe is None or not needs_variants(recipe):
+        return False
+    previous = recipe.image_variants
+    variants = build_variants(recipe)
+    updated = models.Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).update(image_variants=variants, updated_at=timezone.now())
+    if updated:
+        cache.invalidate((recipe_id,))
+        delete_variants_on_commit(recipe_id, previous, keep=variants)
+    else:
+        # Изображение сменилось, пока создавались копии.
+        delete_variants_on_commit(recipe_id, variants)
+    return bool(updated)
+
+
+def generate_in_background(recipe_id):
+    def run():
+        try:
+            generate(recipe_id)
+        except Exception:
+            logger.exception('Не удалось создать превью рецепта %s', recipe_id)
+        finally:
+            close_old_connections()
+
+    executor.submit(run)
+
+
+def get_variant(image_name, variants, variant, image_format='jpeg'):
+    if variants.get('source') == image_name:
+        name = variants.get(variant, {}).get(image_format)
+        if name:
+            return name
+    return image_name
+
+
+def get_variant_urls(image_name, variants, variant):
+    if variants.get('source') != image_name:
+        return {}
+    return {
+        image_format: default_storage.url(name)
+        for image_format, name in variants.get(variant, {}).items()
+    }
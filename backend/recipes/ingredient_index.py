@@ -0,0 +1,90 @@
+import bisect
+import threading
+
+from recipes import models
+from recipes.caching import Namespace
+
+namespace = Namespace('ingredient-index')
+
+
+def fold(value):
+    return value.lower().replace('ё', 'е')
+
+
+def get_version():
+    return namespace.get_version()
+
+
+def bump_version():
+    namespace.bump_version()
+
+
+def load_rows():
+    return sorted(
+        (fold(name), name, pk, measurement_unit)
+        for pk, name, measurement_unit
+        in models.Ingredient.objects.values_list(
+            'pk', 'name', 'measurement_unit'
+        ).iterator()
+    )
+
+
+class IngredientIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.keys = ()
+        self.items = ()
+
+    def build(self):
+        version = get_version()
+        rows = namespace.get_or_set('rows', load_rows)
+        keys = tuple(row[0] for row in rows)
+        items = tuple(
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, name, pk, measurement_unit in rows
+        )
+        self.keys, self.items, self.version = keys, items, version
+
+    def refresh(self):
+        if self.version == get_version():
+            return
+        with self.lock:
+            if self.version != get_version():
+                self.build()
+
+    def all(self):
+        self.refresh()
+        return list(self.items)
+
+    def search(self, query, limit):
+        self.refresh()
+        keys, items = self.keys, self.items
+        query = fold(query.strip())
+        if not query:
+            return list(items[:limit])
+        start = bisect.bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit:
+            if not keys[end].startswith(query):
+                break
+            end += 1
+        result = list(items[start:end])
+        if len(result) >= limit:
+            return result
+        substring = sorted(
+            (
+                (key.find(query), position)
+                for position, key in enumerate(keys)
+                if query in key and not key.startswith(query)
+            ),
+        )
+        result.extend(
+            items[position]
+            for _, position in substring[:limit - len(result)]
+        )
+        return result
+
+
+index = IngredientIndex()
@@ -0,0 +1,535 @@
+import base64
+import io
+import json
+import random
+import re
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import connections
+from recipes import feed, ingredient_index, models, search
+from recipes.caching import Namespace
+from users.models import Follow, User
+
+PASSWORD = 'benchmark-password'
+
+# Команды засевают и удаляют данные в базе приложения, поэтому работают
+# только с базой, имя которой явно говорит, что она тестовая.
+BENCHMARK_DB_NAME = re.compile(r'(^|[_-])(test|bench|benchmark)([_-]|$)')
+
+# (имя, метод, путь, с авторизацией, бюджет SQL-запросов)
+# Бюджет None: маршрут измеряется, но превышение пока не проверяется.
+ROUTES = (
+    ('tags-list', 'get', '/api/tags/', False, 1),
+    ('tags-list', 'get', '/api/tags/', True, 1),
+    ('tags-detail', 'get', '/api/tags/{tag}/', False, 1),
+    ('tags-list-not-modified', 'get', '/api/tags/', False, 0),
+    ('ingredients-list', 'get', '/api/ingredients/', False, 0),
+    ('ingredients-search', 'get', '/api/ingredients/?name={prefix}', False, 0),
+    ('ingredients-search-substring', 'get',
+     '/api/ingredients/?name={infix}', False, 0),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/', False, 1),
+    ('ingredients-list-not-modified', 'get', '/api/ingredients/',
+     False, 0),
+    ('recipes-list', 'get', '/api/recipes/', False, 5),
+    ('recipes-list', 'get', '/api/recipes/', True, 5),
+    ('recipes-list-deep', 'get', '/api/recipes/?page={last_page}', True, 5),
+    ('recipes-list-cursor', 'get', '/api/recipes/?cursor=', True, 4),
+    ('recipes-filter', 'get', '/api/recipes/?tags={slug}&author={author}',
+     False, 7),
+    ('recipes-search', 'get', '/api/recipes/?search={query}', False, 7),
+    ('recipes-search-fuzzy', 'get', '/api/recipes/?search={fuzzy}',
+     False, 7),
+    ('recipes-filter-flags', 'get',
+     '/api/recipes/?is_favorited=1&is_in_shopping_cart=1', True, 5),
+    ('recipes-filter-flags', 'get',
+     '/api/recipes/?is_favorited=1&is_in_shopping_cart=1', False, 0),
+    ('recipes-filter-tags', 'get',
+     '/api/recipes/?tags={slug}&tags={slug2}', False, 5),
+    ('recipes-filter-combo', 'get',
+     '/api/recipes/?tags={slug}&tags={slug2}&is_favorited=1'
+     '&author={favorite_author}', True, 6),
+    ('recipes-filter-combo-cursor', 'get',
+     '/api/recipes/?cursor=&tags={slug}&tags={slug2}&is_favorited=1',
+     True, 5),
+    ('recipes-feed', 'get', '/api/recipes/feed/', True, 5),
+    ('recipes-feed', 'get', '/api/recipes/feed/', False, 0),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', False, 4),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', True, 4),
+    ('recipes-detail-not-modified', 'get', '/api/recipes/{recipe}/',
+     False, 1),
+    ('recipes-detail-not-modified', 'get', '/api/recipes/{recipe}/',
+     True, 1),
+    ('download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', True, 2),
+    ('download-shopping-cart-csv', 'get',
+     '/api/recipes/download_shopping_cart/?type=csv', True, 2),
+    ('download-shopping-cart-pdf', 'get',
+     '/api/recipes/download_shopping_cart/?type=pdf', True, 2),
+    ('users-list', 'get', '/api/users/', False, 1),
+    ('users-detail', 'get', '/api/users/{author}/', False, 1),
+    ('users-me', 'get', '/api/users/me/', True, 1),
+    ('users-subscriptions', 'get', '/api/users/subscriptions/', True, 3),
+    ('users-subscriptions-limit', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', True, 3),
+    ('users-subscriptions-cursor', 'get',
+     '/api/users/subscriptions/?cursor=&recipes_limit=3', True, 2),
+    ('favorite-add', 'post', '/api/recipes/{fresh_recipe}/favorite/',
+     True, 4),
+    ('favorite-remove', 'delete', '/api/recipes/{fresh_recipe}/favorite/',
+     True, 4),
+    ('shopping-cart-add', 'post',
+     '/api/recipes/{fresh_recipe}/shopping_cart/', True, 4),
+    ('shopping-cart-remove', 'delete',
+     '/api/recipes/{fresh_recipe}/shopping_cart/', True, 4),
+    ('subscribe', 'post', '/api/users/{fresh_author}/subscribe/',
+     True, 5),
+    ('unsubscribe', 'delete', '/api/users/{fresh_author}/subscribe/',
+     True, 5),
+    ('favorite-bulk-add', 'post', '/api/recipes/favorite/', True, 5),
+    ('favorite-bulk-remove', 'delete', '/api/recipes/favorite/', True, 4),
+    ('shopping-cart-bulk-add', 'post', '/api/recipes/shopping_cart/',
+     True, 5),
+    ('shopping-cart-clear', 'delete', '/api/recipes/shopping_cart/clear/',
+     True, 4),
+    ('recipes-create-small', 'post', '/api/recipes/', True, 12),
+    ('recipes-create', 'post', '/api/recipes/', True, 12),
+    ('recipes-create-multipart', 'post', '/api/recipes/', True, 12),
+    ('recipes-create-large', 'post', '/api/recipes/', True, 12),
+    ('recipes-create-large-multipart', 'post', '/api/recipes/', True, 12),
+    ('recipes-update', 'patch', '/api/recipes/{created}/', True, 16),
+    ('recipes-delete', 'delete', '/api/recipes/{created}/', True, None),
+    ('users-set-password', 'post', '/api/users/set_password/', True, None),
+    ('token-login', 'post', '/api/auth/token/login/', False, None),
+    ('token-logout', 'post', '/api/auth/token/logout/', True, None),
+)
+
+
+LARGE_IMAGE_SIZE = (2000, 2000)
+
+
+def check_database():
+    name = str(connection.settings_dict['NAME'] or '')
+    if not BENCHMARK_DB_NAME.search(Path(name).stem.lower()):
+        raise CommandError(
+            f'База {name!r} не похожа на тестовую, а команда создаёт и '
+            'удаляет в ней данные. Запустите её на отдельной базе, в имени '
+            'которой есть test или bench (например, foodgram_bench).'
+        )
+
+
+def make_image(size=(64, 64)):
+    buffer = io.BytesIO()
+    if size == (64, 64):
+        Image.new('RGB', size, '#FF0000').save(buffer, 'PNG')
+    else:
+        Image.effect_noise(size, 64).convert('RGB').save(
+            buffer, 'JPEG', quality=95
+        )
+    return buffer.getvalue()
+
+
+def encode_image(content):
+    encoded = base64.b64encode(content).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Засевает базу тестовыми данными, обходит все эндпоинты API и '
+        'измеряет число SQL-запросов, время ответа и размер ответа. '
+        'Все изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=300)
+        parser.add_argument('--recipes', type=int, default=3000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=30)
+        parser.add_argument('--favorites', type=int, default=50)
+        parser.add_argument('--cart', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Путь для JSON-отчёта')
+        parser.add_argument(
+            '--compare', help='JSON-отчёт предыдущего запуска для сравнения'
+        )
+        parser.add_argument(
+            '--no-fail',
+            action='store_true',
+            help='Не завершаться ошибкой при превышении бюджета запросов',
+        )
+
+    def handle(self, **options):
+        check_database()
+        self.random = random.Random(options['seed'])
+        self.created_files = []
+        for namespace in Namespace.registry.values():
+            namespace.reset_stats()
+        connections.reset_stats()
+        setup_ms = self.measure_connection_setup(options['repeat'])
+        with transaction.atomic():
+            dataset = self.seed(options)
+            ingredient_index.index.build()
+            search.index.build()
+            results = self.run_routes(options['repeat'])
+            transaction.set_rollback(True)
+        # Данные откатились, поэтому закэшированное ими больше не годится.
+        for namespace in Namespace.registry.values():
+            namespace.bump_version()
+        for name in self.created_files:
+            default_storage.delete(name)
+
+        report = {
+            'vendor': connection.vendor,
+            'dataset': dataset,
+            'cache': {
+                name: namespace.get_stats()
+                for name, namespace in Namespace.registry.items()
+            },
+            'connection_setup_ms': setup_ms,
+            'connections': connections.get_stats(),
+            'routes': results,
+        }
+        self.print_report(results, options.get('compare'))
+        for name, stats in report['cache'].items():
+            self.stdout.write(
+                f"cache {name}: hits={stats['hits']} "
+                f"misses={stats['misses']} ratio={stats['ratio']}"
+            )
+        self.stdout.write(
+            f'connection setup: {setup_ms}ms, ' + ', '.join(
+                f'{name}={value}'
+                for name, value in report['connections'].items()
+            )
+        )
+        if options.get('output'):
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        failed = [
+            result for result in results
+            if result['budget'] is not None
+            and result['queries'] > result['budget']
+        ]
+        if failed and not options['no_fail']:
+            raise CommandError(
+                'Превышен бюджет запросов: ' + ', '.join(
+                    f"{result['name']} ({result['queries']}"
+                    f" > {result['budget']})"
+                    for result in failed
+                )
+            )
+
+    def measure_connection_setup(self, repeat):
+        timings = []
+        for _ in range(repeat):
+            connection.close()
+            started = time.perf_counter()
+            connection.ensure_connection()
+            timings.append(time.perf_counter() - started)
+        return round(statistics.median(timings) * 1000, 3)
+
+    def seed(self, options):
+        rnd = self.random
+        User.objects.bulk_create(
+            User(
+                email=f'bench{i}@example.com',
+                username=f'bench{i}',
+            )
+            for i in range(options['users'])
+        )
+        users = list(User.objects.filter(username__startswith='bench'))
+        self.user = users[0]
+        self.user.set_password(PASSWORD)
+        self.user.save(update_fields=('password',))
+
+        tags = list(models.Tag.objects.all())
+        if not tags:
+            models.Tag.objects.bulk_create(
+                models.Tag(name=name, color=color, slug=slug)
+                for (color, name), slug in zip(
+                    models.Tag.COLOR_CHOICES,
+                    ('breakfast', 'lunch', 'dinner', 'snack', 'dessert'),
+                )
+            )
+            tags = list(models.Tag.objects.all())
+        models.Ingredient.objects.bulk_create(
+            models.Ingredient(
+                name=f'бенч ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(options['ingredients'])
+        )
+        ingredients = list(
+            models.Ingredient.objects.filter(name__startswith='бенч')
+        )
+
+        models.Recipe.objects.bulk_create(
+            models.Recipe(
+                author=rnd.choice(users),
+                name=f'Рецепт {i}',
+                text='Описание рецепта ' * 20,
+                cooking_time=rnd.randint(1, 120),
+                image='bench.png',
+            )
+            for i in range(options['recipes'])
+        )
+        recipes = list(
+            models.Recipe.objects.filter(image='bench.png').only(
+                'id', 'author_id'
+            )
+        )
+        per_recipe = min(options['ingredients_per_recipe'], len(ingredients))
+        models.IngredientInRecipe.objects.bulk_create(
+            (
+                models.IngredientInRecipe(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=rnd.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in rnd.sample(ingredients, per_recipe)
+            ),
+            batch_size=1000,
+        )
+        models.TagsInRecipe.objects.bulk_create(
+            (
+                models.TagsInRecipe(recipe=recipe, tag=tag)
+                for recipe in recipes
+                for tag in rnd.sample(tags, rnd.randint(1, len(tags)))
+            ),
+            batch_size=1000,
+        )
+
+        search.update_documents([recipe.pk for recipe in recipes])
+
+        others = users[1:]
+        follows = []
+        favorites = []
+        carts = []
+        for user in users:
+            candidates = [other for other in users if other != user]
+            for following in rnd.sample(
+                candidates, min(options['follows'], len(candidates))
+            ):
+                follows.append(Follow(user=user, following=following))
+            for recipe in rnd.sample(
+                recipes, min(options['favorites'], len(recipes))
+            ):
+                favorites.append(models.Favorite(user=user, recipe=recipe))
+            for recipe in rnd.sample(
+                recipes, min(options['cart'], len(recipes))
+            ):
+                carts.append(models.ShoppingCart(user=user, recipe=recipe))
+        Follow.objects.bulk_create(follows, batch_size=1000)
+        models.Favorite.objects.bulk_create(favorites, batch_size=1000)
+        models.ShoppingCart.objects.bulk_create(carts, batch_size=1000)
+        feed.rebuild([user.pk for user in users])
+
+        followed = set(
+            Follow.objects.filter(user=self.user).values_list(
+                'following_id', flat=True
+            )
+        )
+        favorited = set(
+            models.Favorite.objects.filter(user=self.user).values_list(
+                'recipe_id', flat=True
+            )
+        ) | set(
+            models.ShoppingCart.objects.filter(user=self.user).values_list(
+                'recipe_id', flat=True
+            )
+        )
+        recipe = recipes[0]
+        self.context = {
+            'tag': tags[0].id,
+            'slug': tags[0].slug,
+            'slug2': tags[1].slug,
+            'ingredient': ingredients[0].id,
+            'prefix': 'бенч',
+            'infix': 'ингредиент 1',
+            'query': 'рецепт бенч',
+            'fuzzy': 'рецпт',
+            'recipe': recipe.id,
+            'author': recipe.author_id,
+            'favorite_author': models.Favorite.objects.filter(
+                user=self.user
+            ).values_list('recipe__author_id', flat=True).first(),
+            'last_page': max(1, len(recipes) // 6),
+            'fresh_recipe': next(
+                item.id for item in recipes if item.id not in favorited
+            ),
+            'fresh_recipes': [
+                item.id for item in recipes if item.id not in favorited
+            ][:20],
+            'fresh_author': next(
+                other.id for other in others if other.id not in followed
+            ),
+        }
+        self.ingredients = ingredients
+        self.tags = tags
+        self.images = {
+            False: make_image(),
+            True: make_image(LARGE_IMAGE_SIZE),
+        }
+        return {
+            'users': len(users),
+            'recipes': len(recipes),
+            'ingredients': len(ingredients),
+            'follows': len(follows),
+            'favorites': len(favorites),
+            'shopping_cart': len(carts),
+        }
+
+    def get_client(self, authenticated):
+        client = APIClient()
+        if authenticated:
+            token, _ = Token.objects.get_or_create(user=self.user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def get_payload(self, name):
+        if name.startswith(('recipes-create', 'recipes-update')):
+            count = 2 if name.endswith('-small') else 20
+            offset = 10 if name == 'recipes-update' else 0
+            content = self.images['-large' in name]
+            ingredients = [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients[offset:offset + count]
+            ]
+            payload = {
+                'name': 'Рецепт бенчмарка',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'tags': [tag.id for tag in self.tags[:2]],
+            }
+            if name.endswith('-multipart'):
+                image = io.BytesIO(content)
+                image.name = 'bench.jpg'
+                payload['image'] = image
+                payload['ingredients'] = json.dumps(ingredients)
+            else:
+                payload['image'] = encode_image(content)
+                payload['ingredients'] = ingredients
+            return payload
+        if '-bulk-' in name:
+            return {'recipes': self.context['fresh_recipes']}
+        if name == 'users-set-password':
+            return {
+                'new_password': PASSWORD,
+                'current_password': PASSWORD,
+            }
+        if name == 'token-login':
+            return {'email': self.user.email, 'password': PASSWORD}
+        return None
+
+    def call(self, name, method, path, authenticated):
+        client = self.get_client(authenticated)
+        payload = self.get_payload(name)
+        request_format = (
+            'multipart' if name.endswith('-multipart') else 'json'
+        )
+        headers = {}
+        if name.endswith('-not-modified'):
+            etag = client.get(path).get('ETag')
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        # Пиковая память измеряется только для загрузки изображений.
+        trace = payload is not None and 'image' in payload
+        if trace:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(
+                path, payload, format=request_format, **headers
+            )
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            elapsed = time.perf_counter() - started
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if name.startswith('recipes-create') and response.status_code == 201:
+            self.context['created'] = response.data['id']
+            self.created_files.append(
+                models.Recipe.objects.get(pk=response.data['id']).image.name
+            )
+        if name == 'recipes-update' and response.status_code == 200:
+            self.created_files.append(
+                models.Recipe.objects.get(
+                    pk=self.context['created']
+                ).image.name
+            )
+        return response.status_code, len(queries), elapsed, size, peak
+
+    def run_routes(self, repeat):
+        results = []
+        for name, method, template, authenticated, budget in ROUTES:
+            path = template.format(**self.context)
+            timings = []
+            # Записывающие запросы меняют состояние и выполняются один раз.
+            runs = repeat if method == 'get' else 1
+            for _ in range(runs):
+                status_code, queries, elapsed, size, peak = self.call(
+                    name, method, path, authenticated
+                )
+                timings.append(elapsed)
+            results.append({
+                'name': name,
+                'method': method.upper(),
+                'path': path,
+                'authenticated': authenticated,
+                'status': status_code,
+                'queries': queries,
+                'budget': budget,
+                'time_ms': round(statistics.median(timings) * 1000, 3),
+                'bytes': size,
+                'peak_kb': None if peak is None else peak // 1024,
+            })
+        return results
+
+    def print_report(self, results, compare=None):
+        previous = {}
+        if compare:
+            with open(compare, encoding='utf-8') as f:
+                previous = {
+                    (item['name'], item['authenticated']): item
+                    for item in json.load(f)['routes']
+                }
+        for result in results:
+            line = (
+                f"{result['method']:6} {result['name']:30} "
+                f"{'auth' if result['authenticated'] else 'anon':4} "
+                f"{result['status']} "
+                f"q={result['queries']}/"
+                f"{'-' if result['budget'] is None else result['budget']} "
+                f"{result['time_ms']}ms {result['bytes']}b"
+            )
+            if result.get('peak_kb') is not None:
+                line += f" mem={result['peak_kb']}KiB"
+            old = previous.get((result['name'], result['authenticated']))
+            if old:
+                line += (
+                    f" (было q={old['queries']} {old['time_ms']}ms"
+                    f" {old['bytes']}b)"
+                )
+            over = (
+                result['budget'] is not None
+                and result['queries'] > result['budget']
+            )
+            self.stdout.write(
+                self.style.ERROR(line) if over else line
+            )
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from recipes import models
+from recipes.management.commands.benchmark_api import check_database
+from users.models import User
+
+PREFIX = 'concurrency'
+
+# Каждый клиент по кругу ставит и снимает отметки, чтобы запросы
+# оставались успешными при любом числе повторов.
+SCENARIO = (
+    ('POST', '/api/recipes/{recipe}/favorite/'),
+    ('DELETE', '/api/recipes/{recipe}/favorite/'),
+    ('POST', '/api/recipes/{recipe}/shopping_cart/'),
+    ('DELETE', '/api/recipes/{recipe}/shopping_cart/'),
+    ('POST', '/api/users/{author}/subscribe/'),
+    ('DELETE', '/api/users/{author}/subscribe/'),
+)
+
+
+async def read_body(reader, headers):
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                return
+    length = int(headers.get('content-length', 0))
+    if length:
+        await reader.readexactly(length)
+
+
+async def send(connection, host, method, path, token):
+    reader, writer = connection
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\n'
+        f'Host: {host}\r\n'
+        f'Authorization: Token {token}\r\n'
+        'Content-Length: 0\r\n\r\n'.encode()
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    await read_body(reader, headers)
+    return status, headers.get('connection') == 'close'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест переключателей избранного, корзины и подписок '
+        'на запущенном сервере: много одновременных клиентов, пропускная '
+        'способность и задержки. Запустите его против gunicorn с '
+        'синхронными воркерами и против ASGI-воркеров и сравните.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--clients', type=int, default=300)
+        parser.add_argument('--requests', type=int, default=12)
+        parser.add_argument('--output', help='Путь для JSON-отчёта')
+        parser.add_argument(
+            '--compare', help='JSON-отчёт предыдущего запуска для сравнения'
+        )
+
+    def handle(self, **options):
+        # Сервер по --url должен работать с той же базой.
+        check_database()
+        url = urlsplit(options['url'])
+        tokens, context = self.seed(options['clients'])
+        try:
+            started = time.perf_counter()
+            results = asyncio.run(self.run_clients(
+                url, tokens, context, options['requests']
+            ))
+            elapsed = time.perf_counter() - started
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+        latencies = sorted(latency for _, latency in results)
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        report = {
+            'url': options['url'],
+            'clients': options['clients'],
+            'requests': len(results),
+            'statuses': statuses,
+            'elapsed_s': round(elapsed, 3),
+            'rps': round(len(results) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 3),
+            'p95_ms': round(
+                latencies[int(len(latencies) * 0.95) - 1] * 1000, 3
+            ),
+            'p99_ms': round(
+                latencies[int(len(latencies) * 0.99) - 1] * 1000, 3
+            ),
+        }
+        for key, value in report.items():
+            self.stdout.write(f'{key}: {value}')
+        if options.get('compare'):
+            with open(options['compare'], encoding='utf-8') as f:
+                previous = json.load(f)
+            self.stdout.write(
+                f"rps: {previous['rps']} -> {report['rps']} "
+                f"(x{report['rps'] / previous['rps']:.2f}), "
+                f"p95: {previous['p95_ms']}ms -> {report['p95_ms']}ms"
+            )
+        if options.get('output'):
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    def seed(self, clients):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        User.objects.bulk_create(
+            User(email=f'{PREFIX}{i}@example.com', username=f'{PREFIX}{i}')
+            for i in range(clients + 1)
+        )
+        users = list(
+            User.objects.filter(username__startswith=PREFIX).order_by('id')
+        )
+        author, users = users[0], users[1:]
+        models.Recipe.objects.bulk_create([
+            models.Recipe(
+                author=author,
+                name='Рецепт нагрузочного теста',
+                text='Описание',
+                cooking_time=1,
+                image='bench.png',
+            )
+        ])
+        recipe = models.Recipe.objects.get(author=author)
+        Token.objects.bulk_create(
+            Token(key=Token.generate_key(), user=user) for user in users
+        )
+        tokens = list(
+            Token.objects.filter(user__in=users).values_list('key', flat=True)
+        )
+        return tokens, {'recipe': recipe.pk, 'author': author.pk}
+
+    async def run_clients(self, url, tokens, context, requests):
+        results = []
+        await asyncio.gather(*(
+            self.run_client(url, token, context, requests, results)
+            for token in tokens
+        ))
+        return results
+
+    async def run_client(self, url, token, context, requests, results):
+        host = url.hostname
+        port = url.port or 80
+        connection = None
+        for i in range(requests):
+            method, template = SCENARIO[i % len(SCENARIO)]
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            status, close = await send(
+                connection, url.netloc, method,
+                template.format(**context), token,
+            )
+            results.append((status, time.perf_counter() - started))
+            if close:
+                connection[1].close()
+                connection = None
+        if connection is not None:
+            connection[1].close()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes import cache, ingredient_index, search  # noqa: F401
+from recipes.caching import Namespace
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша по пространствам имён.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='Обнулить счётчики'
+        )
+
+    def handle(self, **options):
+        for name, namespace in Namespace.registry.items():
+            stats = namespace.get_stats()
+            self.stdout.write(
+                f"{name}: hits={stats['hits']} misses={stats['misses']} "
+                f"ratio={stats['ratio']}"
+            )
+            if options['reset']:
+                namespace.reset_stats()
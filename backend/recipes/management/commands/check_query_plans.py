@@ -0,0 +1,217 @@
+import json
+import random
+
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from api import shopping_list
+from api.filters import RecipeFilter
+from api_users.paginators import FeedPagination, KeysetPagination
+from api_users.views import get_subscription_recipes, get_subscriptions
+from backend import settings
+from recipes import feed, models
+from recipes.management.commands import benchmark_api
+from users.models import Follow
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan')
+
+# Крупных авторов ветка ленты ищет среди подписок пользователя. Пока
+# пользователей меньше, чем поисков по первичному ключу на каждую
+# подписку, планировщик честно предпочитает прочитать их таблицу целиком.
+ALLOWED_SCANS = {
+    'feed': ('users_user',),
+    'feed-next-page': ('users_user',),
+}
+
+# Записи ленты пользователя на небольших данных планировщику дешевле
+# прочитать по уникальному индексу (user, recipe) и отсортировать.
+TIMELINE_INDEXES = ('timeline_user_pub_date_idx', 'unique timeline entry')
+# При сортировке C обычный индекс по названию тоже ищет по префиксу.
+PREFIX_INDEXES = ('ingredient_name_prefix_idx', 'unique ingredient')
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from walk(child)
+
+
+class Command(benchmark_api.Command):
+    help = (
+        'Засевает PostgreSQL тестовыми данными и проверяет через EXPLAIN, '
+        'что основные запросы (списки, фильтры, список покупок, подписки, '
+        'лента) используют индексы. Завершается с ошибкой, если какой-то '
+        'запрос читает таблицу последовательным сканированием. Все '
+        'изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=20)
+        parser.add_argument('--favorites', type=int, default=30)
+        parser.add_argument('--cart', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--plans', action='store_true', help='Печатать планы целиком'
+        )
+        parser.add_argument('--output', help='Путь для JSON-отчёта')
+
+    def handle(self, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'Планы запросов проверяются только на PostgreSQL'
+            )
+        benchmark_api.check_database()
+        self.random = random.Random(options['seed'])
+        self.created_files = []
+        with transaction.atomic():
+            self.seed(options)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                # На небольших данных планировщик честно выбирает
+                # последовательное чтение. Без него он возьмёт любой
+                # подходящий индекс, и Seq Scan в плане значит, что
+                # индекса для запроса нет.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            results = {
+                name: self.explain(queryset, expected, options['plans'])
+                for name, queryset, expected in self.get_queries()
+            }
+            transaction.set_rollback(True)
+
+        failed = []
+        for name, result in results.items():
+            seq_scans = set(result['seq_scans']) - set(
+                ALLOWED_SCANS.get(name, ())
+            )
+            if seq_scans:
+                failed.append(name)
+                tables = ', '.join(sorted(seq_scans))
+                self.stdout.write(f'{name}: SEQ SCAN {tables}')
+            elif result['missing']:
+                failed.append(name)
+                missing = ', '.join(result['missing'])
+                self.stdout.write(f'{name}: не использует {missing}')
+            else:
+                indexes = ', '.join(result['indexes']) or '-'
+                self.stdout.write(f'{name}: ok ({indexes})')
+            if options['plans']:
+                self.stdout.write(result['plan'])
+        if options.get('output'):
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        if failed:
+            raise CommandError(
+                'Запросы без нужных индексов: ' + ', '.join(failed)
+            )
+
+    def explain(self, queryset, expected, with_plan):
+        # QuerySet.explain() склеивает строки результата в текст, а JSON
+        # psycopg2 уже разбирает сам.
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plans = cursor.fetchone()[0]
+        nodes = [node for plan in plans for node in walk(plan['Plan'])]
+        result = {
+            'seq_scans': sorted({
+                node['Relation Name'] for node in nodes
+                if node['Node Type'] == 'Seq Scan' or (
+                    # Полный проход по чужому индексу с фильтром ничем
+                    # не лучше последовательного чтения.
+                    node['Node Type'] in INDEX_SCANS
+                    and 'Filter' in node
+                    and 'Index Cond' not in node
+                )
+            }),
+            'indexes': sorted({
+                node['Index Name'] for node in nodes if 'Index Name' in node
+            }),
+        }
+        # Условие по второму столбцу чужого индекса тоже попадает
+        # в Index Cond, поэтому для горячих запросов индекс задан явно.
+        # Кортеж перечисляет индексы, любой из которых подходит.
+        result['missing'] = sorted(
+            ' или '.join(names)
+            for names in (
+                (option,) if isinstance(option, str) else option
+                for option in expected
+            )
+            if not set(names) & set(result['indexes'])
+        )
+        if with_plan:
+            result['plan'] = queryset.explain()
+        return result
+
+    def get_queries(self):
+        user = self.user
+        request = RequestFactory().get('/api/recipes/')
+        request.user = user
+        page = settings.PAGINATOR_CONST + 1
+        recipes = models.Recipe.objects.defer('search_document').order_by(
+            *KeysetPagination.ordering
+        )
+        last = recipes[page - 1]
+        authors = list(
+            Follow.objects.filter(user=user).values_list(
+                'following_id', flat=True
+            )[:page]
+        )
+
+        paginator = FeedPagination()
+        sources = feed.get_recipes(user)
+        timeline = paginator.get_page(
+            sources, paginator.ordering, None, page
+        )
+        last_entry = list(timeline)[-1]
+
+        def recipe_filter(data):
+            return RecipeFilter(data, recipes, request=request).qs[:page]
+
+        return (
+            ('recipes', recipes[:page], ('recipe_pub_date_idx',)),
+            ('recipes-next-page', recipes.filter(
+                KeysetPagination.keyset_filter(
+                    KeysetPagination.ordering, (last.pub_date, last.id)
+                )
+            )[:page], ('recipe_pub_date_idx',)),
+            ('recipes-author', recipe_filter(
+                {'author': self.context['author']}
+            ), ('recipe_author_pub_date_idx',)),
+            ('recipes-tags', recipe_filter(
+                {'tags': [self.context['slug']]}
+            ), ()),
+            ('recipes-favorited', recipe_filter({'is_favorited': '1'}), ()),
+            ('recipes-in-cart', recipe_filter(
+                {'is_in_shopping_cart': '1'}
+            ), ()),
+            ('shopping-cart-ingredients', shopping_list.get_ingredients(
+                user
+            ), ()),
+            ('user-flags', models.Favorite.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True), ()),
+            ('subscriptions', get_subscriptions(user)[:page], (
+                'follow_user_idx',
+            )),
+            ('subscription-recipes', get_subscription_recipes(3).filter(
+                author__in=authors
+            ), ('recipe_author_pub_date_idx',)),
+            ('followers', Follow.objects.filter(
+                following=self.context['author']
+            ), ('follow_following_idx',)),
+            ('feed', timeline, (TIMELINE_INDEXES,)),
+            ('feed-next-page', paginator.get_page(
+                sources,
+                paginator.ordering,
+                paginator.get_position(last_entry),
+                page,
+            ), (TIMELINE_INDEXES,)),
+            ('ingredients-prefix', models.Ingredient.objects.filter(
+                name__startswith=self.context['prefix']
+            ), (PREFIX_INDEXES,)),
+        )
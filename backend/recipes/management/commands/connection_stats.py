@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает, сколько соединений с БД открыто заново, сколько '
+        'переиспользовано и сколько проверок их работоспособности '
+        'выполнено.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='Обнулить счётчики'
+        )
+
+    def handle(self, **options):
+        for name, value in connections.get_stats().items():
+            self.stdout.write(f'{name}={value}')
+        if options['reset']:
+            connections.reset_stats()
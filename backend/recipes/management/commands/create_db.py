@@ -1,10 +1,157 @@
-from recipes import models
-from django.core.management.base import BaseCommand
+import csv
+import io
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from backend import settings
+from recipes import ingredient_index, models
+
+TEMP_TABLE = 'ingredient_import'
+EDGE_SPACE = r'^\s|\s$'
 
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV или JSON. '
+        'Уже существующие пары (название, единица) пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(Path(settings.BASE_DIR) / 'ingredients.csv'),
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загрузка через COPY (только PostgreSQL)',
+        )
+
     def handle(self, **options):
-        with open('ingredients.csv') as f:
-            for line in f:
-                ing = line.split(',')
-                models.Ingredient.objects.get_or_create(name=ing[0], measurement_unit=ing[1])
\ No newline at end of file
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        started = time.perf_counter()
+        rows = self.read_rows(path)
+        with transaction.atomic():
+            normalized, merged = self.normalize_existing()
+            before = models.Ingredient.objects.count()
+            if options['copy']:
+                self.load_copy(rows)
+            else:
+                self.load_bulk(rows, options['batch_size'])
+        inserted = models.Ingredient.objects.count() - before
+        if inserted:
+            ingredient_index.bump_version()
+        elapsed = time.perf_counter() - started
+        if normalized:
+            self.stdout.write(
+                f'Очищено от пробелов: {normalized}, из них слито '
+                f'с существующими: {merged}'
+            )
+        self.stdout.write(
+            f'Добавлено: {inserted}, пропущено: {len(rows) - inserted}, '
+            f'время: {elapsed:.2f} с'
+        )
+
+    def normalize_existing(self):
+        # Прежний загрузчик не обрезал пробелы, и строки вроде 'г\n'
+        # не совпали бы с новыми по уникальному ограничению. Такие
+        # ингредиенты переименовываются, а если чистая пара уже есть,
+        # сливаются с ней вместе со ссылками из рецептов.
+        dirty = models.Ingredient.objects.filter(
+            Q(name__regex=EDGE_SPACE) | Q(measurement_unit__regex=EDGE_SPACE)
+        ).order_by('pk')
+        normalized = merged = 0
+        for ingredient in dirty:
+            name = ingredient.name.strip()
+            measurement_unit = ingredient.measurement_unit.strip()
+            target = models.Ingredient.objects.filter(
+                name=name, measurement_unit=measurement_unit
+            ).first()
+            normalized += 1
+            if target is None:
+                ingredient.name = name
+                ingredient.measurement_unit = measurement_unit
+                ingredient.save(update_fields=('name', 'measurement_unit'))
+            else:
+                self.merge(ingredient, target)
+                merged += 1
+        return normalized, merged
+
+    def merge(self, duplicate, target):
+        for row in models.IngredientInRecipe.objects.filter(
+            ingredient=duplicate
+        ):
+            existing = models.IngredientInRecipe.objects.filter(
+                recipe_id=row.recipe_id, ingredient=target
+            ).first()
+            if existing is None:
+                row.ingredient = target
+                row.save(update_fields=('ingredient',))
+                continue
+            # Рецепт ссылался на оба варианта: количества складываются.
+            if row.amount is not None:
+                existing.amount = (existing.amount or 0) + row.amount
+                existing.save(update_fields=('amount',))
+            row.delete()
+        duplicate.delete()
+
+    def read_rows(self, path):
+        with open(path, encoding='utf-8', newline='') as f:
+            if path.suffix == '.json':
+                records = (
+                    (item['name'], item['measurement_unit'])
+                    for item in json.load(f)
+                )
+            else:
+                records = (row for row in csv.reader(f) if row)
+            rows = {}
+            for record in records:
+                if len(record) != 2:
+                    raise CommandError(f'Неверная строка: {record}')
+                name, measurement_unit = (value.strip() for value in record)
+                if name:
+                    rows[(name, measurement_unit)] = None
+        return list(rows)
+
+    def load_bulk(self, rows, batch_size):
+        models.Ingredient.objects.bulk_create(
+            (
+                models.Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in rows
+            ),
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+
+    def load_copy(self, rows):
+        if connection.vendor != 'postgresql':
+            raise CommandError('COPY доступен только для PostgreSQL')
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        table = models.Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {TEMP_TABLE} '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                f'COPY {TEMP_TABLE} (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM {TEMP_TABLE} '
+                'ON CONFLICT DO NOTHING'
+            )
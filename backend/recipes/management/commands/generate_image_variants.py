@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes import images, models
+
+
+class Command(BaseCommand):
+    help = 'Создаёт превью и копии изображений рецептов в WebP/AVIF.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии даже для обработанных изображений',
+        )
+        parser.add_argument(
+            '--recent',
+            type=int,
+            metavar='MINUTES',
+            help=(
+                'Проверить только рецепты, изменённые за последние '
+                'MINUTES минут (для периодического запуска)'
+            ),
+        )
+
+    def handle(self, **options):
+        if options['force']:
+            models.Recipe.objects.update(image_variants={})
+        recipes = models.Recipe.objects.exclude(image='').only(
+            'pk', 'image', 'image_variants'
+        ).order_by('pk')
+        if options['recent'] is not None:
+            recipes = recipes.filter(
+                updated_at__gte=timezone.now() - timedelta(
+                    minutes=options['recent']
+                )
+            )
+        created = failed = 0
+        for recipe in recipes.iterator():
+            if not images.needs_variants(recipe):
+                continue
+            try:
+                created += images.generate(recipe.pk)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+        self.stdout.write(f'Обработано: {created}, ошибок: {failed}')
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes import feed
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Раскладывает рецепты авторов по лентам их подписчиков. '
+        'Существующие записи не трогает.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--recent',
+            type=int,
+            metavar='MINUTES',
+            help=(
+                'Разложить только рецепты, опубликованные за последние '
+                'MINUTES минут (для периодического запуска)'
+            ),
+        )
+
+    def handle(self, **options):
+        if options['recent'] is not None:
+            since = timezone.now() - timedelta(minutes=options['recent'])
+            added = feed.fan_out_recent(since)
+            self.stdout.write(f'Добавлено записей: {added}')
+            return
+        batch_size = options['batch_size']
+        user_ids = list(
+            Follow.objects.order_by('user_id').values_list(
+                'user_id', flat=True
+            ).distinct()
+        )
+        added = 0
+        for start in range(0, len(user_ids), batch_size):
+            added += feed.rebuild(user_ids[start:start + batch_size])
+        self.stdout.write(
+            f'Подписчиков: {len(user_ids)}, добавлено записей: {added}'
+        )
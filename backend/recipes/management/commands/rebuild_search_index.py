@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes import models, search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковые документы рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, **options):
+        batch_size = options['batch_size']
+        recipe_ids = list(
+            models.Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        for start in range(0, len(recipe_ids), batch_size):
+            search.update_documents(recipe_ids[start:start + batch_size])
+        self.stdout.write(f'Обработано рецептов: {len(recipe_ids)}')
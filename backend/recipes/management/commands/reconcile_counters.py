@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики избранного, списков покупок, рецептов '
+        'и подписчиков и исправляет те, что разошлись с данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, **options):
+        batch_size = options['batch_size']
+        for model, (target, _, field) in counters.COUNTERS.items():
+            target_ids = list(
+                target.objects.order_by('pk').values_list('pk', flat=True)
+            )
+            fixed = 0
+            for start in range(0, len(target_ids), batch_size):
+                fixed += counters.reconcile(
+                    model, target_ids[start:start + batch_size]
+                )
+            self.stdout.write(
+                f'{target._meta.model_name}.{field}: '
+                f'проверено {len(target_ids)}, исправлено {fixed}'
+            )
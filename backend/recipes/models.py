@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from backend import settings
+from users.models import CountersMixin
 
 User = get_user_model()
 
@@ -66,16 +67,49 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique ingredient'),
+        )
+        indexes = (
+            # Поиск по началу названия (LIKE 'мол%') не зависит
+            # от правил сортировки базы.
+            models.Index(
+                fields=('name',),
+                name='ingredient_name_prefix_idx',
+                opclasses=('varchar_pattern_ops',),
+            ),
+        )
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_relations(self):
+        return self.defer('search_document').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+
+class Recipe(CountersMixin, models.Model):
+    counter_fields = ('favorites_count', 'in_carts_count')
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
+        db_index=False,
         verbose_name='Автор',
         help_text='Автор'
     )
@@ -112,15 +146,59 @@ class Recipe(models.Model):
         verbose_name='Время публикации',
         help_text='Время публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Время изменения',
+        help_text='Время изменения'
+    )
     image = models.ImageField(
         verbose_name='Изображение',
         help_text='Изображение'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения',
+        help_text='Пути к превью и копиям в других форматах'
+    )
+    search_document = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Поисковый документ',
+        help_text='Название, ингредиенты и описание для поиска'
+    )
+    # Счётчики обновляются вместе со связями (recipes/counters.py),
+    # расхождения исправляет reconcile_counters.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+        help_text='Сколько пользователей добавили рецепт в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+        help_text='Сколько пользователей добавили рецепт в список покупок'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        # Порядок совпадает с keyset-пагинацией (-pub_date, -id).
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -132,11 +210,13 @@ class TagsInRecipe(models.Model):
         Tag,
         verbose_name='Тег в рецепте',
         help_text='Тег в рецепте',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Рецепт',
         help_text='Рецепт'
     )
@@ -144,6 +224,18 @@ class TagsInRecipe(models.Model):
     class Meta:
         verbose_name = 'Теги в рецепте'
         verbose_name_plural = verbose_name
+        # Отдельные индексы по внешним ключам не нужны: (recipe, tag)
+        # покрывает уникальность, (tag, recipe) фильтр по тегам.
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'tag'),
+                name='unique tag in recipe'),
+        )
+        indexes = (
+            models.Index(
+                fields=('tag', 'recipe'), name='tags_in_recipe_tag_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.tag} in {self.recipe}'
@@ -159,6 +251,7 @@ class IngredientInRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Рецепт',
         help_text='Рецепт'
     )
@@ -172,6 +265,19 @@ class IngredientInRecipe(models.Model):
     class Meta:
         verbose_name = 'Количетсво ингредиента в рецепте'
         verbose_name_plural = verbose_name
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique ingredient in recipe'),
+        )
+        # Сумма для списка покупок читается только из индекса.
+        indexes = (
+            models.Index(
+                fields=('recipe',),
+                include=('ingredient', 'amount'),
+                name='ingredient_in_recipe_cover_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.ingredient} in {self.recipe}'
@@ -233,3 +339,44 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} added in shopping_cart {self.recipe}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        db_index=False,
+        verbose_name='Подписчик',
+        help_text='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+        help_text='Рецепт'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Время публикации',
+        help_text='Копия времени публикации рецепта для сортировки'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique timeline entry'),
+        )
+        # Страница ленты - один диапазон этого индекса.
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} in timeline of {self.user}'
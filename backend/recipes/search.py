@@ -0,0 +1,296 @@
+import bisect
+import difflib
+import re
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Case, FloatField, Q, Value, When
+
+from backend import replicas, settings
+from recipes import models
+from recipes.caching import Namespace
+
+CONFIG = settings.RECIPE_SEARCH_CONFIG
+TOKEN_RE = re.compile(r'\w+')
+NAME_WEIGHT = 3
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+namespace = Namespace('recipe-search')
+
+_pending = threading.local()
+
+
+def fold(value):
+    return value.lower().replace('ё', 'е')
+
+
+def tokenize(value):
+    return TOKEN_RE.findall(fold(value))
+
+
+def weigh(document):
+    name, ingredients, text = (document.split('\n', 2) + ['', ''])[:3]
+    weights = defaultdict(int)
+    for weight, part in (
+        (NAME_WEIGHT, name),
+        (INGREDIENT_WEIGHT, ingredients),
+        (TEXT_WEIGHT, text),
+    ):
+        for token in tokenize(part):
+            weights[token] += weight
+    return weights
+
+
+def build_document(name, ingredients, text):
+    return '\n'.join((
+        name.replace('\n', ' '),
+        ' '.join(ingredients).replace('\n', ' '),
+        text,
+    ))
+
+
+def update_documents(recipe_ids):
+    recipe_ids = set(recipe_ids)
+    recipes = list(
+        models.Recipe.objects.filter(pk__in=recipe_ids).only(
+            'pk', 'name', 'text', 'search_document'
+        )
+    )
+    ingredients = defaultdict(list)
+    for recipe_id, name in models.IngredientInRecipe.objects.filter(
+        recipe__in=recipes
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredients[recipe_id].append(name)
+    # Рецепты, которых больше нет, тоже попадают в журнал изменений.
+    changed_ids = recipe_ids - {recipe.pk for recipe in recipes}
+    changed = []
+    for recipe in recipes:
+        document = build_document(
+            recipe.name, ingredients[recipe.pk], recipe.text
+        )
+        if recipe.search_document != document:
+            recipe.search_document = document
+            changed.append(recipe)
+            changed_ids.add(recipe.pk)
+    if changed:
+        models.Recipe.objects.bulk_update(
+            changed, ('search_document',), batch_size=500
+        )
+    if changed_ids:
+        record_changes(changed_ids)
+
+
+def schedule_update(recipe_ids):
+    pending = _pending.__dict__.setdefault('ids', set())
+    pending.update(recipe_ids)
+    transaction.on_commit(flush_updates)
+
+
+def flush_updates():
+    recipe_ids = getattr(_pending, 'ids', None)
+    if recipe_ids:
+        _pending.ids = set()
+        update_documents(recipe_ids)
+
+
+def get_version():
+    return namespace.get_version()
+
+
+def make_changes_key(version):
+    return namespace.make_key('changes', version)
+
+
+def record_changes(recipe_ids):
+    # Каждая версия хранит рецепты, которые её породили, и индексы
+    # в памяти других процессов обновляют только их.
+    version = namespace.bump_version()
+    cache.set(
+        make_changes_key(version),
+        list(recipe_ids),
+        settings.RECIPE_SEARCH_CHANGES_TIMEOUT,
+    )
+
+
+def get_changes(since, version):
+    if since is None or not 0 < version - since <= (
+        settings.RECIPE_SEARCH_MAX_CHANGES
+    ):
+        return None
+    keys = [
+        make_changes_key(number) for number in range(since + 1, version + 1)
+    ]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return set().union(*found.values())
+
+
+def load_weights(recipe_ids):
+    with replicas.use_primary():
+        return {
+            pk: weigh(document)
+            for pk, document in models.Recipe.objects.filter(
+                pk__in=recipe_ids
+            ).values_list('pk', 'search_document')
+        }
+
+
+class InvertedIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.postings = {}
+        self.tokens = []
+        self.documents = {}
+
+    def build(self):
+        version = get_version()
+        postings = defaultdict(dict)
+        documents = {}
+        with replicas.use_primary():
+            rows = models.Recipe.objects.values_list(
+                'pk', 'search_document'
+            ).iterator()
+            for pk, document in rows:
+                weights = weigh(document)
+                for token, weight in weights.items():
+                    postings[token][pk] = weight
+                documents[pk] = tuple(weights)
+        self.postings = dict(postings)
+        self.tokens = sorted(self.postings)
+        self.documents = documents
+        self.version = version
+
+    def update(self, recipe_ids, version):
+        weights = load_weights(recipe_ids)
+        touched = set()
+        for pk in recipe_ids:
+            touched.update(self.documents.get(pk, ()))
+        for token_weights in weights.values():
+            touched.update(token_weights)
+        # Поиск читает индекс без блокировки, поэтому изменённые
+        # списки копируются, а не правятся на месте.
+        postings = dict(self.postings)
+        for token in touched:
+            postings[token] = {
+                pk: score for pk, score in postings.get(token, {}).items()
+                if pk not in recipe_ids
+            }
+        for pk, token_weights in weights.items():
+            for token, weight in token_weights.items():
+                postings[token][pk] = weight
+        for token in touched:
+            if not postings[token]:
+                del postings[token]
+        # Сначала списки, потом слова: поиск по словам из старого
+        # набора получит пустой список, а не KeyError.
+        tokens_changed = any(
+            (token in self.postings) != (token in postings)
+            for token in touched
+        )
+        self.postings = postings
+        if tokens_changed:
+            self.tokens = sorted(postings)
+        # Слова рецептов нужны только обновлению под блокировкой.
+        for pk in recipe_ids:
+            self.documents.pop(pk, None)
+        self.documents.update(
+            (pk, tuple(token_weights)) for pk, token_weights in weights.items()
+        )
+        self.version = version
+
+    def refresh(self):
+        if self.version == get_version():
+            return
+        with self.lock:
+            version = get_version()
+            if self.version == version:
+                return
+            recipe_ids = get_changes(self.version, version)
+            if recipe_ids is None:
+                self.build()
+            else:
+                self.update(recipe_ids, version)
+
+    def expand(self, token):
+        tokens = self.tokens
+        start = bisect.bisect_left(tokens, token)
+        matches = {}
+        for candidate in tokens[start:]:
+            if not candidate.startswith(token):
+                break
+            matches[candidate] = 1.0 if candidate == token else 0.8
+        if not matches:
+            for candidate in difflib.get_close_matches(
+                token, tokens, n=3, cutoff=0.75
+            ):
+                matches[candidate] = 0.5
+        return matches
+
+    def search(self, query):
+        self.refresh()
+        scores = None
+        for token in tokenize(query):
+            token_scores = defaultdict(float)
+            for candidate, factor in self.expand(token).items():
+                for pk, weight in self.postings.get(candidate, {}).items():
+                    token_scores[pk] = max(token_scores[pk], weight * factor)
+            if scores is None:
+                scores = dict(token_scores)
+            else:
+                scores = {
+                    pk: score + token_scores[pk]
+                    for pk, score in scores.items()
+                    if pk in token_scores
+                }
+            if not scores:
+                return []
+        if not scores:
+            return []
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:settings.RECIPE_SEARCH_FALLBACK_LIMIT]
+
+
+index = InvertedIndex()
+
+
+def search_postgres(queryset, query):
+    from django.contrib.postgres.search import (
+        SearchQuery,
+        SearchRank,
+        SearchVector,
+        TrigramSimilarity,
+    )
+
+    vector = SearchVector('search_document', config=CONFIG)
+    search_query = SearchQuery(query, config=CONFIG, search_type='websearch')
+    return queryset.annotate(search_vector=vector).filter(
+        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+    ).annotate(
+        search_rank=SearchRank(vector, search_query) + TrigramSimilarity(
+            'name', query
+        ),
+    ).order_by('-search_rank', '-pub_date')
+
+
+def search_fallback(queryset, query):
+    ranked = index.search(query)
+    if not ranked:
+        return queryset.none()
+    return queryset.filter(pk__in=[pk for pk, _ in ranked]).annotate(
+        search_rank=Case(
+            *(When(pk=pk, then=Value(score)) for pk, score in ranked),
+            output_field=FloatField(),
+        ),
+    ).order_by('-search_rank', '-pub_date')
+
+
+def search(queryset, query):
+    if connections[queryset.db].vendor == 'postgresql':
+        return search_postgres(queryset, query)
+    return search_fallback(queryset, query)
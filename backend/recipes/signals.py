@@ -0,0 +1,312 @@
+import functools
+import threading
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes import (
+    cache,
+    counters,
+    feed,
+    images,
+    ingredient_index,
+    models,
+    search,
+)
+from users.models import Follow
+
+USER_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+_touched = threading.local()
+_invalidated = threading.local()
+_deleting = threading.local()
+
+
+def invalidate_on_commit(recipe_ids):
+    # Идентификаторы копятся до commit, чтобы каскадное удаление
+    # сбрасывало кэш одним вызовом, а не по вызову на строку.
+    pending = _invalidated.__dict__.setdefault('recipes', set())
+    pending.update(recipe_ids)
+    transaction.on_commit(flush_invalidated)
+
+
+def invalidate_user_flags_on_commit(user_ids):
+    pending = _invalidated.__dict__.setdefault('users', set())
+    pending.update(user_ids)
+    transaction.on_commit(flush_invalidated)
+
+
+def flush_invalidated():
+    recipe_ids = getattr(_invalidated, 'recipes', None)
+    if recipe_ids:
+        _invalidated.recipes = set()
+        cache.invalidate(recipe_ids)
+    user_ids = getattr(_invalidated, 'users', None)
+    if user_ids:
+        _invalidated.users = set()
+        cache.invalidate_user_flags(user_ids)
+
+
+def clear_deleting():
+    _deleting.__dict__.clear()
+
+
+def is_pending(connection, callback):
+    # Откат транзакции или точки сохранения заменяет список отложенных
+    # on_commit, поэтому обычно хватает сравнить список целиком.
+    pending = getattr(_deleting, 'pending', None)
+    if pending is connection.run_on_commit:
+        return True
+    if any(func is callback for sids, func in connection.run_on_commit):
+        _deleting.pending = connection.run_on_commit
+        return True
+    return False
+
+
+def get_deleting(instance, name):
+    # Collector шлёт pre_delete и post_delete в одной транзакции. Если
+    # удаление упало между ними, транзакция откатывается вместе с
+    # clear_deleting из on_commit, и оставшиеся пометки сбрасываются,
+    # а не прячут строки следующих удалений.
+    callback = getattr(_deleting, 'callback', None)
+    if callback is not None and not is_pending(
+        transaction.get_connection(instance._state.db), callback
+    ):
+        clear_deleting()
+    return _deleting.__dict__.setdefault(name, set())
+
+
+def mark_deleting(instance, name):
+    if not any(get_deleting(instance, key) for key in ('users', 'recipes')):
+        # Новое удаление регистрирует свою функцию, чтобы откат его точки
+        # сохранения не путался с функцией прошлого удаления.
+        clear_deleting()
+        callback = functools.partial(clear_deleting)
+        transaction.on_commit(callback, using=instance._state.db)
+        _deleting.callback = callback
+        _deleting.pending = transaction.get_connection(
+            instance._state.db
+        ).run_on_commit
+    get_deleting(instance, name).add(instance.pk)
+
+
+def parent_deleted(instance):
+    # Строка удаляется каскадом вместе с рецептом или пользователем:
+    # счётчики уже поправлены в pre_delete родителя или удаляются
+    # вместе с ним, лента и кэш рецепта уходят вместе с родителем.
+    users = get_deleting(instance, 'users')
+    recipes = get_deleting(instance, 'recipes')
+    return bool(
+        users and users.intersection(
+            getattr(instance, field, None)
+            for field in ('user_id', 'following_id', 'author_id')
+        )
+        or recipes and getattr(instance, 'recipe_id', None) in recipes
+    )
+
+
+def touch_on_commit(recipe_ids):
+    pending = _touched.__dict__.setdefault('ids', set())
+    pending.update(recipe_ids)
+    transaction.on_commit(flush_touched)
+
+
+def flush_touched():
+    recipe_ids = getattr(_touched, 'ids', None)
+    if recipe_ids:
+        _touched.ids = set()
+        models.Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver(post_save, sender=models.Recipe)
+@receiver(post_delete, sender=models.Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_on_commit((instance.pk,))
+
+
+@receiver(post_save, sender=models.IngredientInRecipe)
+@receiver(post_delete, sender=models.IngredientInRecipe)
+@receiver(post_save, sender=models.TagsInRecipe)
+@receiver(post_delete, sender=models.TagsInRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    if parent_deleted(instance):
+        return
+    invalidate_on_commit((instance.recipe_id,))
+    touch_on_commit((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=models.Recipe.tags.through)
+@receiver(m2m_changed, sender=models.Recipe.ingredients.through)
+def recipe_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_on_commit((instance.pk,))
+        touch_on_commit((instance.pk,))
+    elif pk_set:
+        invalidate_on_commit(pk_set)
+        touch_on_commit(pk_set)
+    else:
+        transaction.on_commit(cache.bump_version)
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+@receiver(post_save, sender=models.Ingredient)
+@receiver(post_delete, sender=models.Ingredient)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(cache.bump_version)
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(cache.tags.bump_version)
+
+
+@receiver(post_save, sender=models.Favorite)
+@receiver(post_delete, sender=models.Favorite)
+@receiver(post_save, sender=models.ShoppingCart)
+@receiver(post_delete, sender=models.ShoppingCart)
+def user_flags_changed(sender, instance, **kwargs):
+    invalidate_user_flags_on_commit((instance.user_id,))
+
+
+@receiver(post_save, sender=models.Favorite)
+@receiver(post_save, sender=models.ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=models.Recipe)
+def counter_added(sender, instance, created, **kwargs):
+    if created:
+        counters.instance_changed(instance, 1)
+
+
+@receiver(post_delete, sender=models.Favorite)
+@receiver(post_delete, sender=models.ShoppingCart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=models.Recipe)
+def counter_removed(sender, instance, **kwargs):
+    if not parent_deleted(instance):
+        counters.instance_changed(instance, -1)
+
+
+@receiver(pre_delete, sender=models.Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    mark_deleting(instance, 'recipes')
+
+
+@receiver(pre_delete, sender=models.User)
+def user_deleting(sender, instance, **kwargs):
+    mark_deleting(instance, 'users')
+    # Счётчики чужих рецептов и авторов, которых касались строки
+    # пользователя, - одной командой на связь вместо команды на строку.
+    counters.release(Follow, Follow.objects.filter(user=instance))
+    for model in (models.Favorite, models.ShoppingCart):
+        counters.release(model, model.objects.filter(user=instance))
+
+
+@receiver(post_delete, sender=models.Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    get_deleting(instance, 'recipes').discard(instance.pk)
+
+
+@receiver(post_delete, sender=models.User)
+def user_deleted(sender, instance, **kwargs):
+    get_deleting(instance, 'users').discard(instance.pk)
+
+
+@receiver(post_save, sender=models.Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: feed.fan_out_in_background(instance.pk)
+        )
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    if not parent_deleted(instance):
+        feed.prune(instance.user_id, instance.following_id)
+
+
+@receiver(post_save, sender=models.Ingredient)
+@receiver(post_delete, sender=models.Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(ingredient_index.bump_version)
+
+
+@receiver(post_save, sender=models.User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields and not USER_FIELDS.intersection(update_fields):
+        return
+    # Сохранение без update_fields (админка, смена пароля) обычно не
+    # трогает полей, которые попадают в содержимое рецептов.
+    if not instance.has_changed(USER_FIELDS):
+        return
+    recipes = models.Recipe.objects.filter(author=instance)
+    invalidate_on_commit(recipes.values_list('pk', flat=True))
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=models.Recipe)
+def recipe_document_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'search_document'}:
+        return
+    search.schedule_update((instance.pk,))
+
+
+@receiver(post_save, sender=models.IngredientInRecipe)
+@receiver(post_delete, sender=models.IngredientInRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    if not parent_deleted(instance):
+        search.schedule_update((instance.recipe_id,))
+
+
+@receiver(post_save, sender=models.Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if created:
+        return
+    search.schedule_update(
+        models.IngredientInRecipe.objects.filter(
+            ingredient=instance
+        ).values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=models.Recipe)
+def recipe_document_deleted(sender, instance, **kwargs):
+    search.schedule_update((instance.pk,))
+
+
+@receiver(post_save, sender=models.Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    if images.needs_variants(instance):
+        # Копии прежнего изображения больше не отдаются.
+        images.delete_variants_on_commit(
+            instance.pk, instance.image_variants
+        )
+        transaction.on_commit(
+            lambda: images.generate_in_background(instance.pk)
+        )
+
+
+@receiver(post_delete, sender=models.Recipe)
+def recipe_image_deleted(sender, instance, **kwargs):
+    images.delete_variants_on_commit(instance.pk, instance.image_variants)
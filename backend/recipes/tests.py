@@ -0,0 +1,344 @@
+import io
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import pre_delete
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from backend import settings
+from recipes import counters, feed, images, models
+from recipes.caching import Namespace
+from users.models import Follow, User
+
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+class CountersSaveTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        models.Recipe.objects.bulk_create([models.Recipe(
+            author=self.user,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=1,
+            image='recipe.png',
+        )])
+        self.recipe = models.Recipe.objects.get(author=self.user)
+
+    def test_save_keeps_counters(self):
+        recipe = models.Recipe.objects.get(pk=self.recipe.pk)
+        models.Favorite.objects.create(user=self.user, recipe=self.recipe)
+        models.ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+
+    def test_user_save_keeps_recipes_count(self):
+        user = User.objects.get(pk=self.user.pk)
+        counters.change(models.Recipe, self.user.pk, 1)
+        user.first_name = 'Имя'
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.recipes_count, 1)
+
+
+class FailedDeleteTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        models.Recipe.objects.bulk_create([models.Recipe(
+            author=self.user,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=1,
+            image='recipe.png',
+        )])
+        self.recipe = models.Recipe.objects.get(author=self.user)
+        models.Favorite.objects.create(user=self.user, recipe=self.recipe)
+
+    def fail_delete(self, instance):
+        def fail(**kwargs):
+            raise RuntimeError('delete failed')
+
+        pre_delete.connect(fail, sender=type(instance))
+        try:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    instance.delete()
+        finally:
+            pre_delete.disconnect(fail, sender=type(instance))
+
+    def test_failed_recipe_delete_keeps_counters(self):
+        self.fail_delete(self.recipe)
+        models.Favorite.objects.get(recipe=self.recipe).delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_failed_delete_after_successful_one(self):
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='pass'
+        )
+        other.delete()
+        self.fail_delete(self.recipe)
+        models.Favorite.objects.get(recipe=self.recipe).delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_failed_user_delete_keeps_counters(self):
+        self.fail_delete(self.user)
+        models.Favorite.objects.get(recipe=self.recipe).delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class NamespaceTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.namespace = Namespace('test')
+
+    def start_holder(self, compute):
+        # Первый поток берёт блокировку и вычисляет, пока его не отпустят.
+        started = threading.Event()
+        release = threading.Event()
+        result = {}
+
+        def holder_compute():
+            started.set()
+            release.wait(5)
+            return compute()
+
+        def run():
+            try:
+                result['value'] = self.namespace.get_or_set(
+                    'key', holder_compute
+                )
+            except ValueError as error:
+                result['error'] = error
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        started.wait(5)
+        return thread, release, result
+
+    def test_waiter_gets_holder_value(self):
+        thread, release, result = self.start_holder(lambda: 'holder')
+        threading.Timer(0.2, release.set).start()
+        value = self.namespace.get_or_set('key', lambda: 'waiter')
+        thread.join(5)
+        self.assertEqual(value, 'holder')
+        self.assertEqual(result['value'], 'holder')
+
+    def test_waiter_computes_when_holder_fails(self):
+        def fail():
+            raise ValueError('compute failed')
+
+        thread, release, result = self.start_holder(fail)
+        threading.Timer(0.2, release.set).start()
+        started = time.monotonic()
+        value = self.namespace.get_or_set('key', lambda: 'waiter')
+        elapsed = time.monotonic() - started
+        thread.join(5)
+        self.assertIn('error', result)
+        self.assertEqual(value, 'waiter')
+        self.assertLess(elapsed, 2)
+
+    def test_bump_version_invalidates(self):
+        self.assertEqual(self.namespace.get_or_set('key', lambda: 1), 1)
+        self.assertEqual(self.namespace.get_or_set('key', lambda: 2), 1)
+        self.namespace.bump_version()
+        self.assertEqual(self.namespace.get_or_set('key', lambda: 3), 3)
+
+    def test_checked_value_written_during_invalidation_is_not_read(self):
+        def compute():
+            # Данные поменялись, пока значение считалось.
+            self.namespace.invalidate_many(['key'])
+            return 'stale'
+
+        self.assertEqual(
+            self.namespace.get_or_set_checked('key', compute), 'stale'
+        )
+        self.assertEqual(
+            self.namespace.get_or_set_checked('key', lambda: 'fresh'),
+            'fresh',
+        )
+        self.assertEqual(
+            self.namespace.get_or_set_checked('key', lambda: 'other'),
+            'fresh',
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class FeedTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        self.follower = User.objects.create_user(
+            email='follower@example.com', username='follower', password='pass'
+        )
+        Follow.objects.create(user=self.follower, following=self.author)
+
+    def create_recipes(self, count):
+        # bulk_create не шлёт сигналов, и рецепты не попадают в ленты.
+        models.Recipe.objects.bulk_create([
+            models.Recipe(
+                author=self.author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=1,
+                image='recipe.png',
+            )
+            for number in range(count)
+        ])
+
+    def get_timeline(self):
+        return set(models.TimelineEntry.objects.filter(
+            user=self.follower
+        ).values_list('recipe_id', flat=True))
+
+    def test_fan_out(self):
+        self.create_recipes(1)
+        recipe = models.Recipe.objects.get(author=self.author)
+        self.assertEqual(feed.fan_out(recipe.pk), 1)
+        self.assertEqual(self.get_timeline(), {recipe.pk})
+        self.assertEqual(feed.fan_out(recipe.pk), 0)
+
+    def test_fan_out_recent_restores_lost_entries(self):
+        self.create_recipes(2)
+        since = timezone.now() - timedelta(minutes=1)
+        self.assertEqual(feed.fan_out_recent(since), 2)
+        self.assertEqual(
+            self.get_timeline(),
+            set(models.Recipe.objects.values_list('id', flat=True)),
+        )
+        self.assertEqual(feed.fan_out_recent(since), 0)
+
+    def test_pagination(self):
+        self.create_recipes(settings.PAGINATOR_CONST * 2 + 1)
+        feed.rebuild([self.follower.pk])
+        expected = list(models.Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        client = APIClient()
+        client.force_authenticate(self.follower)
+
+        url = '/api/recipes/feed/?count=1'
+        pages = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url = response.data['next']
+        self.assertEqual(pages[0]['count'], len(expected))
+        self.assertNotIn('count', pages[1])
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(
+            [recipe['id'] for page in pages for recipe in page['results']],
+            expected,
+        )
+
+        response = client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+    def test_invalid_cursor(self):
+        client = APIClient()
+        client.force_authenticate(self.follower)
+        response = client.get('/api/recipes/feed/?cursor=bad')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ImageVariantsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(
+            email='author@example.com', username='author', password='pass'
+        )
+        models.Recipe.objects.bulk_create([models.Recipe(
+            author=self.user,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=1,
+            image=self.save_image('red'),
+        )])
+        self.recipe = models.Recipe.objects.get(author=self.user)
+
+    def save_image(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (32, 32), color).save(buffer, 'PNG')
+        return default_storage.save(
+            'recipes/image.png', ContentFile(buffer.getvalue())
+        )
+
+    def generate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(images.generate(self.recipe.pk))
+        self.recipe.refresh_from_db()
+        return images.get_variant_names(
+            self.recipe.pk, self.recipe.image_variants
+        )
+
+    def assertFilesExist(self, names, exist=True):
+        for name in names:
+            self.assertEqual(default_storage.exists(name), exist, name)
+
+    def test_regenerating_deletes_previous_variants(self):
+        previous = self.generate()
+        self.assertTrue(previous)
+        self.assertFilesExist(previous)
+        models.Recipe.objects.filter(pk=self.recipe.pk).update(
+            image=self.save_image('blue')
+        )
+        current = self.generate()
+        self.assertFalse(previous & current)
+        self.assertFilesExist(current)
+        self.assertFilesExist(previous, exist=False)
+
+    def test_image_change_deletes_variants_on_commit(self):
+        previous = self.generate()
+        self.recipe.image = self.save_image('blue')
+        with mock.patch.object(images, 'generate_in_background') as generate:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.recipe.save()
+            self.assertFilesExist(previous)
+            for callback in callbacks:
+                callback()
+        generate.assert_called_once_with(self.recipe.pk)
+        self.assertFilesExist(previous, exist=False)
+
+    def test_recipe_delete_deletes_variants(self):
+        previous = self.generate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertFilesExist(previous, exist=False)
@@ -2,10 +2,34 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CountersMixin:
+    # Счётчики меняют только команды UPDATE из recipes/counters.py.
+    # Полное сохранение записало бы значения, прочитанные вместе
+    # с объектом, и стёрло бы изменения, сделанные с тех пор.
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and not self._state.adding
+            and not kwargs.get('force_insert')
+            and kwargs.get('update_fields') is None
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username',)
+    counter_fields = ('recipes_count', 'followers_count')
 
     email = models.EmailField(
         max_length=254,
@@ -31,15 +55,70 @@ class User(AbstractUser):
         verbose_name='Фамилия',
         help_text='Фамилия'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+        help_text='Количество рецептов автора'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+        help_text='Количество подписчиков автора'
+    )
     def __str__(self):
         return f'{self.username}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения из базы: по ним сигналы после save видят, какие поля
+        # действительно изменились.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is not None:
+            for field in loaded:
+                loaded[field] = getattr(self, field)
+
+    def refresh_from_db(self, using=None, fields=None):
+        # Пользователь из кэша токенов загружен без полей (см.
+        # api_users/authentication.py): первое обращение к любому
+        # отложенному полю дочитывает их все одним запросом.
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using, fields)
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is not None:
+            if fields is None:
+                fields = [
+                    field.attname for field in self._meta.concrete_fields
+                ]
+            loaded.update((field, getattr(self, field)) for field in fields)
+
+    def has_changed(self, fields):
+        # Без загруженной строки (объект создан в коде) изменения
+        # неизвестны и считаются.
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(
+            field not in loaded or loaded[field] != getattr(self, field)
+            for field in fields
+        )
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='follower',
+        db_index=False,
         verbose_name='Подписчик',
         help_text='Подписчик'
     )
@@ -47,6 +126,7 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='following',
+        db_index=False,
         verbose_name='Автор',
         help_text='Автор'
     )
@@ -62,6 +142,13 @@ class Follow(models.Model):
                 check=~models.Q(user=models.F('following')),
                 name='do not selffollow'),
         )
+        # (user, id) отдаёт подписки пользователя в порядке пагинации.
+        indexes = (
+            models.Index(fields=('user', 'id'), name='follow_user_idx'),
+            models.Index(
+                fields=('following', 'user'), name='follow_following_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user.username} подписан на {self.following.username}'